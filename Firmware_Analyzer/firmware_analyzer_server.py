@@ -18,27 +18,41 @@ import threading
 import queue
 import requests
 import json
-from collections import Counter
+from collections import Counter, deque
 import math
 from concurrent.futures import ThreadPoolExecutor
-from contextlib import contextmanager
+from contextlib import contextmanager, ExitStack
 from capstone import *
 import aiohttp
 import asyncio
 from functools import lru_cache
 import numpy as np
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, Future, as_completed, wait, FIRST_COMPLETED
 import pickle
 from datetime import datetime, timedelta
 from tqdm import tqdm
 import lzma
+import zlib
 import struct
 import shutil
 import fnmatch
 from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
 import werkzeug.utils
+import werkzeug.exceptions
 import tempfile
+import bisect
+import hashlib
+import sqlite3
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
 def check_dependencies():
     missing_deps = []
@@ -76,149 +90,1128 @@ os.makedirs(RESULTS_DIR, exist_ok=True)
 app = Flask(__name__)
 CORS(app)
 
+def load_request_baseline():
+    """The baseline named by the request, or None; raises ValueError for unknown ones.
+
+    Clients can only name an earlier analysis by its ID, never a file on the server.
+    """
+    reference = request.values.get('baseline')
+    return load_baseline(reference, allow_paths=False) if reference else None
+
 @app.route('/analyze', methods=['POST'])
 def analyze_firmware():
-    if 'firmware' not in request.files:
-        return jsonify({'error': 'No firmware file provided'}), 400
+    # A raw application/octet-stream body is streamed straight to disk;
+    # multipart uploads come from Werkzeug's parsed form
+    if request.mimetype == 'application/octet-stream':
+        filename = request.args.get('filename', 'firmware.bin')
+        stream = request.stream
+    else:
+        if 'firmware' not in request.files:
+            return jsonify({'error': 'No firmware file provided'}), 400
+        firmware_file = request.files['firmware']
+        if firmware_file.filename == '':
+            return jsonify({'error': 'No selected file'}), 400
+        filename, stream = firmware_file.filename, firmware_file.stream
     
-    firmware_file = request.files['firmware']
-    if firmware_file.filename == '':
-        return jsonify({'error': 'No selected file'}), 400
+    # Optional baseline analysis for incremental re-analysis
+    try:
+        baseline = load_request_baseline()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
+    # Everything this job writes besides its results goes in its own workspace,
+    # which the job removes when it ends
+    upload = UploadSession(filename, baseline=baseline, expected_size=request.content_length or 0)
     try:
-        # Save uploaded file with secure filename
-        firmware_path = os.path.join(UPLOAD_DIR, werkzeug.utils.secure_filename(firmware_file.filename))
-        firmware_file.save(firmware_path)
-        
-        # Extract and analyze firmware
-        extracted_dir = extract_firmware(firmware_path)
-        all_vulnerabilities = []
-        all_files = []
-        total_size = 0
-        
-        # Collect files for analysis
-        for root, _, files in os.walk(extracted_dir):
-            for file in files:
-                full_path = os.path.join(root, file)
-                try:
-                    if os.path.splitext(file)[1].lower() in {'.jpg', '.png', '.gif', '.mp3', '.mp4'}:
-                        continue
-                    size = os.path.getsize(full_path)
-                    if size < 64 or size > 10_000_000:
-                        continue
-                    total_size += size
-                    if total_size > 500 * 1024 * 1024:
-                        break
-                    all_files.append(full_path)
-                except:
-                    continue
-        
-        # Process files in chunks
-        chunk_size = 50
-        for i in range(0, len(all_files), chunk_size):
-            chunk = all_files[i:i + chunk_size]
-            vulns = parallel_file_scan(chunk, verbose=False)
-            if vulns:
-                all_vulnerabilities.extend(vulns)
-        
-        # Generate and save JSON report
-        report = generate_report(all_vulnerabilities, output_json=True)
-        timestamp = time.strftime("%Y%m%d-%H%M%S")
-        result_filename = f"{os.path.splitext(firmware_file.filename)[0]}_{timestamp}_results.json"
-        result_path = os.path.join(RESULTS_DIR, result_filename)
-        
-        with open(result_path, 'w') as f:
-            f.write(report)
-        
-        # Clean up
-        try:
-            shutil.rmtree(extracted_dir)
-            os.remove(firmware_path)
-        except:
-            pass
-        
-        # Send the results file
-        return send_file(
-            result_path,
-            mimetype='application/json',
-            as_attachment=True,
-            download_name=result_filename
-        )
-        
+        # Save uploaded file with secure filename, hashing it as it streams in
+        upload.append(stream)
+        if stream is request.stream and request.content_length and upload.offset != request.content_length:
+            upload.workspace.cleanup()
+            return jsonify({'error': 'Upload interrupted; use /uploads to resume large uploads'}), 400
+        job = upload.start_job()
+    except werkzeug.exceptions.RequestEntityTooLarge as e:
+        upload.workspace.cleanup()
+        return jsonify({'error': e.description}), 413
     except Exception as e:
+        upload.workspace.cleanup()
         return jsonify({'error': str(e)}), 500
+    
+    # In async mode the client gets the job at once and polls /jobs/<id>
+    if request.values.get('async', '').lower() in ('1', 'true', 'yes'):
+        response = jsonify(job.status())
+        response.status_code = 202
+        response.headers['Location'] = f"/jobs/{job.job_id}"
+        return response
+    
+    try:
+        job.future.result()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    return job_results(job)
+
+def upload_response(session, status_code=200):
+    response = jsonify(session.status())
+    response.status_code = status_code
+    response.headers['Upload-Offset'] = str(session.offset)
+    response.headers['Location'] = f"/uploads/{session.upload_id}"
+    return response
+
+@app.route('/uploads', methods=['POST'])
+def create_upload():
+    """Start a resumable upload of Upload-Length bytes"""
+    try:
+        length = int(request.headers['Upload-Length'])
+    except (KeyError, ValueError):
+        return jsonify({'error': 'Upload-Length header required'}), 400
+    if not 0 < length <= MAX_UPLOAD_SIZE:
+        return jsonify({'error': f"Upload-Length must be 1 to {MAX_UPLOAD_SIZE} bytes"}), 413
+    try:
+        baseline = load_request_baseline()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    session = open_upload_session(request.values.get('filename', 'firmware.bin'), length, baseline)
+    return upload_response(session, 201)
+
+@app.route('/uploads/<upload_id>', methods=['GET', 'HEAD'])
+def upload_status(upload_id):
+    session = get_upload_session(upload_id)
+    if session is None:
+        return jsonify({'error': 'Unknown upload'}), 404
+    return upload_response(session)
+
+@app.route('/uploads/<upload_id>', methods=['PATCH'])
+def upload_chunk(upload_id):
+    """Append the request body to an upload at Upload-Offset.
+
+    The upload's analysis job starts as soon as the last byte arrives; its
+    status is in the response's job field.
+    """
+    session = get_upload_session(upload_id)
+    if session is None:
+        return jsonify({'error': 'Unknown upload'}), 404
+    if not session.lock.acquire(blocking=False):
+        return jsonify({'error': 'Another request is writing this upload'}), 409
+    try:
+        if session.job:
+            return upload_response(session)
+        try:
+            offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            return jsonify({'error': 'Upload-Offset header required'}), 400
+        if offset != session.offset:
+            return upload_response(session, 409)
+        try:
+            session.append(request.stream)
+        except werkzeug.exceptions.RequestEntityTooLarge as e:
+            return jsonify({'error': e.description}), 413
+        if session.complete:
+            session.start_job()
+        return upload_response(session)
+    finally:
+        session.lock.release()
+
+def job_results(job):
+    """Send a finished job's report file"""
+    response = send_file(
+        job.result_path,
+        mimetype='application/json',
+        as_attachment=True,
+        download_name=os.path.basename(job.result_path)
+    )
+    response.headers['X-Analysis-Id'] = job.analysis_id
+    response.headers['X-Job-Id'] = job.job_id
+    response.headers.update(job.cache_headers)
+    return response
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = get_job_scheduler().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.status())
+
+@app.route('/jobs/<job_id>/results', methods=['GET'])
+def job_report(job_id):
+    job = get_job_scheduler().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if job.stage == 'failed':
+        return jsonify({'error': job.error}), 500
+    if job.stage != 'done':
+        return jsonify({'error': f"Job is {job.stage}"}), 409
+    return job_results(job)
+
+def analyze_upload(firmware_path, firmware_hash, filename, baseline, job, signatures=None):
+    """Analyze a saved upload for a job, recording the result on it.
+
+    An identical upload with the same options gets its stored report back.
+    Otherwise the firmware is extracted (or its cached tree reused), scanned
+    and reported, with the job's stage and file counts kept up to date.
+    """
+    options = report_options(baseline)
+    cached = load_cached_report(firmware_hash, options)
+    if cached:
+        job.analysis_id, job.result_path = cached
+        job.cache_headers = {'X-Report-Cache': 'hit'}
+        return
+    
+    # Extract the firmware, or reuse the tree of an identical earlier upload
+    job.stage = 'extracting'
+    extraction_cache = get_extraction_cache()
+    cache_key, extracted_dir, extraction_hit = extraction_cache.acquire(firmware_path, firmware_hash, signatures)
+    analysis_id = make_analysis_id(filename)
+    
+    try:
+        # Collect files for analysis, rescanning only what changed since the baseline
+        job.stage = 'indexing'
+        file_sizes = collect_files(extracted_dir)
+        manifest = build_manifest(analysis_id, firmware_path, extracted_dir, file_sizes)
+        apply_symbol_findings(manifest, build_symbol_index(manifest))
+        pending = apply_baseline(manifest, baseline)
+        entries = {entry['path']: entry for entry in manifest['files'].values()}
+        job.start_scan(len(pending))
+        for index, vulns in iter_file_scan(pending, verbose=False, sizes=file_sizes,
+                                           described=manifest_described(manifest)):
+            entries[pending[index]]['findings'] = vulns
+            job.files_done += 1
+        all_vulnerabilities = manifest_findings(manifest)
+        delta = compare_manifests(baseline, manifest) if baseline else None
+        save_manifest(manifest)
+    finally:
+        extraction_cache.release(cache_key)
+    
+    # Generate and save JSON report
+    job.stage = 'reporting'
+    report = generate_report(all_vulnerabilities, output_json=True, delta=delta,
+                             file_classes=manifest_file_classes(manifest))
+    result_path = os.path.join(RESULTS_DIR, f"{analysis_id}_results.json")
+    
+    with open(result_path, 'w') as f:
+        f.write(report)
+    store_cached_report(firmware_hash, options, analysis_id, result_path)
+    
+    job.analysis_id, job.result_path = analysis_id, result_path
+    job.cache_headers = {'X-Extraction-Cache': 'hit' if extraction_hit else 'miss', 'X-Report-Cache': 'miss'}
 
 # Function to extract firmware using binwalk
-def extract_firmware(firmware_path):
+def extract_firmware(firmware_path, extract_dir=None, signatures=None):
     print("Analyzing firmware...")
     
     # Create extraction directory if it doesn't exist
-    base_name = os.path.splitext(os.path.basename(firmware_path))[0]
-    extract_dir = f"_{base_name}.extracted"
+    if extract_dir is None:
+        base_name = os.path.splitext(os.path.basename(firmware_path))[0]
+        extract_dir = f"_{base_name}.extracted"
     if not os.path.exists(extract_dir):
         os.makedirs(extract_dir)
 
-    # First try binwalk extraction
+    # Carve the image and everything nested in it on the process pool
     try:
-        subprocess.run(['binwalk', '-e', '-M', '--run-as=root', 
-                       '-C', extract_dir, firmware_path], 
-                      check=True, capture_output=True)
-    except:
-        print("Binwalk extraction failed, trying alternative methods...")
-    
-    # Handle LZMA compressed data
-    try:
-        with open(firmware_path, 'rb') as f:
-            data = f.read()
-        
-        
-        # Try to extract LZMA at offset 66560
-        lzma_data = data[66560:]
-        decompressed = lzma.decompress(lzma_data)
-        with open(os.path.join(extract_dir, "kernel.bin"), 'wb') as f:
-            f.write(decompressed)
-        
-        # Try to extract SquashFS at offset 1049088
-        squashfs_data = data[1049088:]
-        squashfs_file = os.path.join(extract_dir, "rootfs.squashfs")
-        with open(squashfs_file, 'wb') as f:
-            f.write(squashfs_data)
-        
-        # Extract SquashFS
-        os.makedirs(os.path.join(extract_dir, "squashfs-root"), exist_ok=True)
-        subprocess.run(['unsquashfs', '-d', 
-                       os.path.join(extract_dir, "squashfs-root"),
-                       squashfs_file], check=False)
+        carved = carve_firmware(firmware_path, extract_dir, signatures=signatures)
+        print(f"Carved {len(carved)} segments, {sum(segment['depth'] > 0 for segment in carved)} of them nested")
     except Exception as e:
-        print(f"Alternative extraction method failed: {e}")
+        print(f"Extraction failed: {e}")
+        carved = []
+
+    # Fall back to binwalk when carving produced no filesystem to analyze
+    if not any(segment['roots'] for segment in carved):
+        try:
+            subprocess.run(['binwalk', '-e', '-M', '--run-as=root', 
+                           '-C', extract_dir, firmware_path], 
+                          check=True, capture_output=True)
+        except:
+            print("Binwalk extraction failed")
 
     return extract_dir
 
+# Headers the carver recognizes, matched in one pass over the image
+CARVE_SIGNATURES = re.compile(
+    rb'(?P<lzma>\x5d\x00\x00(?:[\x01\x02\x04\x08\x10\x20\x40\x80]\x00|\x00[\x01\x02\x04\x08\x10\x20\x40]))'
+    rb'|(?P<gzip>\x1f\x8b\x08[\x00-\x1f])'
+    rb'|(?P<xz>\xfd7zXZ\x00)'
+    rb'|(?P<squashfs>hsqs|sqsh)'
+    rb'|(?P<jffs2>\x85\x19(?:[\x01\x02]\xe0|[\x03\x04\x06]\x20)|\x19\x85(?:\xe0[\x01\x02]|\x20[\x03\x04\x06]))'
+    rb'|(?P<ubi>UBI#\x01)'
+    rb'|(?P<uimage>\x27\x05\x19\x56)'
+    rb'|(?P<cpio>07070[12])'
+)
+# Streams that mark their own end; other segments are sized from their headers
+SELF_DELIMITING = {'lzma', 'gzip', 'xz'}
+CARVE_MAX_OUTPUT = 512 * 1024 * 1024  # per decompressed segment
+CARVE_MIN_OUTPUT = 512  # a stream that decodes to less is taken as a false match
+UIMAGE_COMPRESSION = {0: 'raw', 1: 'gzip', 3: 'lzma'}
+# Per-firmware extraction limits, against zip-bomb style images
+EXTRACT_MAX_DEPTH = 4
+EXTRACT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+EXTRACT_MAX_FILES = 20000
+# Files one carving task may write, so no single task takes the whole file budget
+EXTRACT_TASK_FILES = 5000
+# How often an external unpacker's output is measured against its budget
+EXTRACTOR_POLL = 0.5
+# File classes that are carved again when found inside an extracted filesystem
+NESTED_CLASSES = {'gzip', 'xz', 'lzma', 'squashfs', 'jffs2', 'cpio'}
+
+# Bytes of the image find_signatures looks up per NumPy batch
+CARVE_BATCH_BYTES = 4 * 1024 * 1024
+# First two bytes of each signature, as a lookup table over byte pairs
+CARVE_PREFIXES = (b'\x5d\x00', b'\x1f\x8b', b'\xfd7', b'hs', b'sq', b'\x85\x19', b'\x19\x85',
+                  b'UB', b'\x27\x05', b'07')
+_CARVE_PREFIX_TABLE = np.zeros(1 << 16, dtype=bool)
+for _prefix in CARVE_PREFIXES:
+    _CARVE_PREFIX_TABLE[_prefix[0] << 8 | _prefix[1]] = True
+
+def find_signatures(image):
+    """Return (offset, kind) for every carvable header in image (bytes or an mmap).
+
+    Every byte pair of the image is looked up in _CARVE_PREFIX_TABLE with
+    NumPy, a batch at a time; CARVE_SIGNATURES is only tried at the few
+    offsets that start a signature's prefix.
+    """
+    data = np.frombuffer(image, dtype=np.uint8)
+    hits = []
+    for start in range(0, len(data) - 1, CARVE_BATCH_BYTES):
+        batch = data[start:start + CARVE_BATCH_BYTES + 1]
+        pairs = batch[:-1].astype(np.uint16) << 8 | batch[1:]
+        for offset in (np.flatnonzero(_CARVE_PREFIX_TABLE[pairs]) + start).tolist():
+            match = CARVE_SIGNATURES.match(image, offset)
+            if match:
+                hits.append((offset, match.lastgroup))
+    return hits
+
+def inflate_to_file(view, kind, out_path, max_output=CARVE_MAX_OUTPUT):
+    """Decompress the gzip, lzma or xz stream at the start of view into out_path.
+
+    view is fed to the decompressor STREAM_WINDOW bytes at a time and output
+    is written as it is produced, capped at max_output. Returns how many bytes
+    of view the stream used, or None if it didn't decode.
+    """
+    if kind == 'gzip':
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    else:
+        decompressor = lzma.LZMADecompressor(lzma.FORMAT_ALONE if kind == 'lzma' else lzma.FORMAT_XZ)
+    written = 0
+    used = len(view)
+    with open(out_path, 'wb') as out:
+        try:
+            for position in range(0, len(view), STREAM_WINDOW):
+                chunk = view[position:position + STREAM_WINDOW]
+                fed = len(chunk)
+                while chunk is not None and written < max_output and not decompressor.eof:
+                    data = decompressor.decompress(chunk, min(STREAM_WINDOW, max_output - written))
+                    out.write(data)
+                    written += len(data)
+                    if kind == 'gzip':
+                        chunk = decompressor.unconsumed_tail or None
+                    else:
+                        chunk = b'' if not decompressor.needs_input else None
+                if decompressor.eof:
+                    used = position + fed - len(decompressor.unused_data)
+                    break
+                if written >= max_output:
+                    break
+        except (lzma.LZMAError, zlib.error, EOFError):
+            pass
+    if written < CARVE_MIN_OUTPUT:
+        os.remove(out_path)
+        return None
+    return used
+
+def _squashfs_size(view, offset):
+    """bytes_used from a SquashFS 4 superblock, or None for other versions.
+
+    Older versions are told apart from stray magic numbers too unreliably to
+    carve.
+    """
+    if offset + 48 > len(view):
+        return None
+    endian = '<' if bytes(view[offset:offset + 4]) == b'hsqs' else '>'
+    major, = struct.unpack_from(endian + 'H', view, offset + 28)
+    if major != 4:
+        return None
+    return struct.unpack_from(endian + 'Q', view, offset + 40)[0]
+
+def _header_crc_ok(view, kind, offset):
+    """Check the header CRC of a JFFS2 node or UBI erase-counter block"""
+    if kind == 'jffs2':
+        if offset + 12 > len(view):
+            return False
+        endian = '<' if view[offset] == 0x85 else '>'
+        stored, = struct.unpack_from(endian + 'I', view, offset + 8)
+        return stored == zlib.crc32(view[offset:offset + 8], 0xffffffff) ^ 0xffffffff
+    if offset + 64 > len(view):
+        return False
+    stored, = struct.unpack_from('>I', view, offset + 60)
+    return stored == zlib.crc32(view[offset:offset + 60]) ^ 0xffffffff
+
+def cpio_entries(view, start, end):
+    """Parse the newc cpio archive at view[start:end].
+
+    Returns ([(name, mode, data offset, size)], offset after the trailer, or
+    where parsing stopped).
+    """
+    def aligned(position):
+        return start + (position - start + 3 & ~3)
+
+    entries = []
+    position = start
+    while position + 110 <= end:
+        header = bytes(view[position:position + 110])
+        if header[:6] not in (b'070701', b'070702'):
+            break
+        try:
+            fields = [int(header[6 + 8 * i:14 + 8 * i], 16) for i in range(13)]
+        except ValueError:
+            break
+        mode, file_size, name_size = fields[1], fields[6], fields[11]
+        name = bytes(view[position + 110:position + 110 + name_size]).rstrip(b'\0').decode('latin-1')
+        data = aligned(position + 110 + name_size)
+        position = aligned(data + file_size)
+        if name == 'TRAILER!!!':
+            return entries, position
+        entries.append((name, mode, data, file_size))
+    return entries, min(position, end)
+
+def extract_cpio(view, start, end, out_dir, max_files=EXTRACT_MAX_FILES):
+    """Unpack a newc cpio archive from view[start:end] into out_dir.
+
+    Regular files are written straight from view and directories created;
+    links and device nodes are skipped, and so is everything after max_files
+    files. Returns where the archive ends.
+    """
+    entries, archive_end = cpio_entries(view, start, end)
+    written = 0
+    root = os.path.realpath(out_dir)
+    for name, mode, data, file_size in entries:
+        target = os.path.realpath(os.path.join(root, name.lstrip('/')))
+        if not target.startswith(root + os.sep):
+            continue
+        if mode & 0o170000 == 0o040000:
+            os.makedirs(target, exist_ok=True)
+        elif mode & 0o170000 == 0o100000 and data + file_size <= end and written < max_files:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(view[data:data + file_size])
+            written += 1
+    return archive_end
+
+def _run_extractor(command, out_dir, max_output, max_files):
+    """Run an external unpacker, discarding its output if it passes max_output or max_files"""
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except OSError:
+        print(f"Note: {command[0]} not available, left the raw image in place")
+        return
+    while True:
+        try:
+            process.wait(timeout=EXTRACTOR_POLL)
+        except subprocess.TimeoutExpired:
+            size, count = _tree_weight([out_dir])
+            if size <= max_output and count <= max_files:
+                continue
+            process.kill()
+            process.wait()
+        break
+    size, count = _tree_weight([out_dir])
+    if size > max_output or count > max_files:
+        print(f"Note: {command[0]} output passed the extraction budget, discarded it")
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+def carve_segment(view, kind, offset, bound, extract_dir, max_output=CARVE_MAX_OUTPUT,
+                  max_files=EXTRACT_MAX_FILES):
+    """Extract the kind segment at offset, which cannot run past bound.
+
+    Returns (end, files, roots, raw): where the segment ends, the files it
+    decompressed to, the directories a filesystem was unpacked into and the
+    raw images written for external unpackers; or None if the header was a
+    false match or the segment doesn't fit in max_output. Outputs are named
+    after the offset.
+    Everything is read through slices of view, so nothing is copied in memory;
+    raw segments are written straight to disk for the external unpackers.
+    """
+    output = os.path.join(extract_dir, f"{offset:X}")
+    if kind in SELF_DELIMITING:
+        used = inflate_to_file(view[offset:], kind, output, max_output)
+        return (offset + used, [output], [], []) if used else None
+
+    if kind == 'uimage':
+        if offset + 64 > bound:
+            return None
+        data_size, = struct.unpack_from('>I', view, offset + 12)
+        payload = UIMAGE_COMPRESSION.get(view[offset + 31], 'raw')
+        end = min(offset + 64 + data_size, bound)
+        if payload == 'raw':
+            with open(output, 'wb') as f:
+                f.write(view[offset + 64:end])
+        elif not inflate_to_file(view[offset + 64:end], payload, output, max_output):
+            return end, [], [], []
+        return end, [output], [], []
+
+    if kind == 'cpio':
+        out_dir = output + '-cpio-root'
+        os.makedirs(out_dir, exist_ok=True)
+        end = extract_cpio(view, offset, bound, out_dir, max_files)
+        if end <= offset:
+            shutil.rmtree(out_dir, ignore_errors=True)
+            return None
+        return end, [], [out_dir], []
+
+    if kind in ('jffs2', 'ubi') and not _header_crc_ok(view, kind, offset):
+        return None
+    if kind == 'squashfs':
+        size = _squashfs_size(view, offset)
+        if not size:
+            return None
+        end = min(offset + size, bound)
+    else:
+        end = bound
+    if end - offset > max_output:
+        print(f"Note: {kind} image at {offset:#x} is larger than the extraction budget, skipped it")
+        return None
+    raw_path = f"{output}.{kind}"
+    with open(raw_path, 'wb') as f:
+        f.write(view[offset:end])
+    out_dir = f"{output}-{kind}-root"
+    budget = (out_dir, max_output - (end - offset), max_files)
+    if kind == 'squashfs':
+        _run_extractor(['unsquashfs', '-d', out_dir, raw_path], *budget)
+    elif kind == 'jffs2':
+        _run_extractor(['jefferson', '-d', out_dir, raw_path], *budget)
+    elif kind == 'ubi':
+        _run_extractor(['ubireader_extract_files', '-o', out_dir, raw_path], *budget)
+    return end, [], [out_dir] if os.path.isdir(out_dir) else [], [raw_path]
+
+# Erase-block sizes tried when following a UBI image's block chain
+UBI_PEB_SIZES = [1 << shift for shift in range(12, 22)]
+# Erased flash between JFFS2 nodes: 0xff (or zero) words up to the next node
+JFFS2_PADDING = re.compile(rb'(?:\xff\xff\xff\xff|\x00\x00\x00\x00)*')
+
+def _ubi_size(image, offset):
+    """Length of the chain of UBI erase blocks at offset, or None for a single block"""
+    peb = next((size for size in UBI_PEB_SIZES
+                if bytes(image[offset + size:offset + size + 4]) == b'UBI#'
+                and _header_crc_ok(image, 'ubi', offset + size)), None)
+    if peb is None:
+        return None
+    end = position = offset
+    while position + 64 <= len(image):
+        if bytes(image[position:position + 4]) == b'UBI#' and _header_crc_ok(image, 'ubi', position):
+            end = position + peb
+        elif bytes(image[position:position + peb]).count(b'\xff') != min(peb, len(image) - position):
+            break
+        position += peb
+    return min(end, len(image)) - offset
+
+def _jffs2_size(image, offset):
+    """Length of the chain of JFFS2 nodes at offset, padding between them included"""
+    magic = bytes(image[offset:offset + 2])
+    endian = '<' if magic == b'\x85\x19' else '>'
+    end = position = offset
+    while position + 12 <= len(image):
+        if bytes(image[position:position + 2]) == magic and _header_crc_ok(image, 'jffs2', position):
+            total_length, = struct.unpack_from(endian + 'I', image, position + 4)
+            if total_length < 12:
+                break
+            position = end = position + total_length + 3 & ~3
+            continue
+        padding = JFFS2_PADDING.match(image, position).end()
+        if padding == position:
+            break
+        position = padding
+    return min(end, len(image)) - offset or None
+
+def _segment_size(image, kind, offset):
+    """Size of a segment as its headers give it, else None"""
+    if kind == 'squashfs':
+        return _squashfs_size(image, offset)
+    if kind == 'uimage' and offset + 64 <= len(image):
+        return 64 + struct.unpack_from('>I', image, offset + 12)[0]
+    if kind == 'cpio':
+        return cpio_entries(image, offset, len(image))[1] - offset or None
+    if kind == 'jffs2':
+        return _jffs2_size(image, offset)
+    if kind == 'ubi':
+        return _ubi_size(image, offset)
+    return None
+
+def plan_segments(image, hits=None):
+    """Return (offset, kind, bound) for each segment of image worth carving.
+
+    hits are image's find_signatures results if already known. bound is as
+    far as the segment may run: the size its headers give (see
+    _segment_size), with any header inside it left out, or for streams the
+    end of the image. A single-block UBI image runs to the next header of
+    another kind.
+    """
+    if hits is None:
+        hits = find_signatures(image)
+    kept = []
+    covered = 0
+    for offset, kind in hits:
+        if offset < covered:
+            continue
+        if kind in ('jffs2', 'ubi') and not _header_crc_ok(image, kind, offset):
+            continue
+        size = _segment_size(image, kind, offset)
+        kept.append((offset, kind, size))
+        if size:
+            covered = offset + size
+
+    bounds = [len(image)] * len(kept)
+    for index in range(len(kept) - 2, -1, -1):
+        if kept[index + 1][1] == kept[index][1]:
+            bounds[index] = bounds[index + 1]
+        else:
+            bounds[index] = kept[index + 1][0]
+
+    segments = []
+    covered = 0
+    for (offset, kind, size), bound in zip(kept, bounds):
+        if offset < covered:
+            continue
+        if size:
+            bound = min(offset + size, len(image))
+        elif kind in ('jffs2', 'ubi'):
+            covered = bound
+        else:
+            bound = len(image)
+        segments.append((offset, kind, bound))
+    return segments
+
+def plan_carve(file_path, hits=None):
+    """plan_segments for a file on disk, run in a pool worker"""
+    with map_file(file_path) as image:
+        return plan_segments(image, hits)
+
+def _tree_weight(paths):
+    """Total bytes and number of files under paths"""
+    size = count = 0
+    for path in paths:
+        if os.path.isfile(path):
+            size += os.path.getsize(path)
+            count += 1
+        for dirpath, _, names in os.walk(path):
+            for name in names:
+                full_path = os.path.join(dirpath, name)
+                if not os.path.islink(full_path):
+                    size += os.path.getsize(full_path)
+                    count += 1
+    return size, count
+
+def carve_task(args):
+    """Carve one segment of a file in a pool worker.
+
+    Returns the segment as a dict with its kind, offset, end, files, roots
+    and raw images (see carve_segment) and the bytes and file count it
+    produced, or None.
+    """
+    file_path, kind, offset, bound, out_dir, max_output, max_files = args
+    os.makedirs(out_dir, exist_ok=True)
+    with map_file(file_path) as image, memoryview(image) as view:
+        result = carve_segment(view, kind, offset, bound, out_dir, max_output, max_files)
+    if result is None:
+        return None
+    end, files, roots, raw = result
+    size, count = _tree_weight(files + roots + raw)
+    return {'kind': kind, 'offset': offset, 'end': end, 'files': files, 'roots': roots,
+            'raw': raw, 'bytes': size, 'count': count}
+
+def _remove_outputs(segment):
+    for path in segment['files'] + segment['raw']:
+        if os.path.exists(path):
+            os.remove(path)
+    for path in segment['roots']:
+        shutil.rmtree(path, ignore_errors=True)
+
+def nested_archives(segment):
+    """Files a carved segment produced that should be carved in turn"""
+    yield from segment['files']
+    for root in segment['roots']:
+        for dirpath, _, names in os.walk(root):
+            for name in names:
+                path = os.path.join(dirpath, name)
+                try:
+                    if not os.path.islink(path) and classify_file(path) in NESTED_CLASSES:
+                        yield path
+                except OSError:
+                    continue
+
+def _name_outputs(segments, extract_dir, top_level):
+    """Name carved outputs by kind (gzip, gzip-1, jffs2-root...) so manifest keys don't depend on offsets.
+
+    In the image itself (top_level) the kernel and root filesystem become
+    kernel.bin and squashfs-root, as the rest of the tool expects.
+    """
+    kernel = os.path.join(extract_dir, 'kernel.bin')
+    squashfs_root = os.path.join(extract_dir, 'squashfs-root')
+    seen = Counter()
+
+    def rename(paths, index, target):
+        if os.path.exists(target):
+            return
+        os.rename(paths[index], target)
+        paths[index] = target
+
+    for segment in segments:
+        kind = segment['kind']
+        if top_level and kind in ('lzma', 'uimage') and segment['files'] and not os.path.exists(kernel):
+            rename(segment['files'], 0, kernel)
+            continue
+        if top_level and kind == 'squashfs' and segment['roots'] and not os.path.exists(squashfs_root):
+            rename(segment['roots'], 0, squashfs_root)
+        stem = os.path.join(extract_dir, f"{kind}-{seen[kind]}" if seen[kind] else kind)
+        seen[kind] += 1
+        for index in range(len(segment['files'])):
+            rename(segment['files'], index, stem)
+        for index in range(len(segment['roots'])):
+            rename(segment['roots'], index, f"{stem}-root")
+        for index in range(len(segment['raw'])):
+            rename(segment['raw'], index, f"{stem}.{kind}")
+
+def carve_firmware(firmware_path, extract_dir, max_depth=EXTRACT_MAX_DEPTH,
+                   max_bytes=EXTRACT_MAX_BYTES, max_files=EXTRACT_MAX_FILES, signatures=None):
+    """Recursively extract a firmware image into extract_dir on the process pool.
+
+    Each carving task reserves its share of max_bytes and max_files up front;
+    nested archives are carved into _<name>.extracted up to max_depth.
+    Returns the carved segments, each with the path it came from and its depth.
+    """
+    pool = task_pool()
+    carved = []
+    used_bytes = used_files = 0
+    reserved_bytes = reserved_files = 0
+    exhausted = False
+    pending = {}  # future -> (task, file path, output directory, depth, reserved share)
+    waiting = deque()  # segments held back until the budget has room: (path, kind, offset, bound, out_dir, depth)
+    outstanding = {}  # file path -> segments still waiting or being carved
+    results = {}  # file path -> segments carved so far
+    pending[pool.submit(plan_carve, firmware_path, signatures)] = ('plan', firmware_path, extract_dir, 0, None)
+
+    def settle(path, out_dir, depth):
+        """Keep a file's carved segments once all are done and queue what they produced"""
+        nonlocal used_bytes, used_files
+        del outstanding[path]
+        accepted = []
+        covered = 0
+        for segment in sorted(results.pop(path), key=lambda s: s['offset']):
+            if segment['offset'] < covered:
+                _remove_outputs(segment)
+                used_bytes -= segment['bytes']
+                used_files -= segment['count']
+                continue
+            accepted.append(segment)
+            covered = segment['end']
+        _name_outputs(accepted, out_dir, depth == 0)
+        for segment in accepted:
+            carved.append(dict(segment, path=path, depth=depth))
+            if depth + 1 >= max_depth or exhausted:
+                continue
+            for nested in nested_archives(segment):
+                nested_dir = os.path.join(os.path.dirname(nested), f"_{os.path.basename(nested)}.extracted")
+                pending[pool.submit(plan_carve, nested)] = ('plan', nested, nested_dir, depth + 1, None)
+
+    while pending or waiting:
+        # Hand what is left of the budget to waiting segments
+        while waiting and not exhausted:
+            free_bytes = max_bytes - used_bytes - reserved_bytes
+            free_files = max_files - used_files - reserved_files
+            if free_bytes <= 0 or free_files <= 0:
+                break
+            path, kind, offset, bound, out_dir, depth = waiting.popleft()
+            share = (min(CARVE_MAX_OUTPUT, free_bytes), min(EXTRACT_TASK_FILES, free_files))
+            reserved_bytes += share[0]
+            reserved_files += share[1]
+            args = (path, kind, offset, bound, out_dir) + share
+            pending[pool.submit(carve_task, args)] = ('carve', path, out_dir, depth, share)
+
+        if exhausted or not pending:
+            # Segments that can never get a share count as done
+            while waiting:
+                path, _, _, _, out_dir, depth = waiting.popleft()
+                outstanding[path] -= 1
+                if not outstanding[path]:
+                    settle(path, out_dir, depth)
+        if not pending:
+            continue
+
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            task, path, out_dir, depth, share = pending.pop(future)
+            result = None
+            if not future.cancelled():
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Extraction of {path} failed: {e}")
+
+            if task == 'plan':
+                outstanding[path] = 0
+                results[path] = []
+                if not exhausted:
+                    for offset, kind, bound in result or []:
+                        waiting.append((path, kind, offset, bound, out_dir, depth))
+                        outstanding[path] += 1
+            else:
+                outstanding[path] -= 1
+                reserved_bytes -= share[0]
+                reserved_files -= share[1]
+                if result:
+                    results[path].append(result)
+                    used_bytes += result['bytes']
+                    used_files += result['count']
+                if not exhausted and (used_bytes >= max_bytes or used_files >= max_files):
+                    exhausted = True
+                    print(f"Extraction budget reached ({used_bytes} bytes, {used_files} files), "
+                          "not extracting further")
+                    for other in pending:
+                        other.cancel()
+
+            if not outstanding[path]:
+                settle(path, out_dir, depth)
+    return carved
+
+# ELF header and section table fields we need, keyed by (EI_CLASS, EI_DATA)
+ELF_MAGIC = b'\x7fELF'
+ELFCLASS64 = 2
+ELFDATA2MSB = 2
+SHT_DYNAMIC = 6
+SHT_NOTE = 7
+SHT_NOBITS = 8
+SHT_DYNSYM = 11
+SHF_EXECINSTR = 0x4
+PT_LOAD = 1
+PT_DYNAMIC = 2
+PT_NOTE = 4
+
+def _elf_formats(elf_class, elf_data):
+    """Struct formats for the header, section, program header, dynamic entry and symbol."""
+    endian = '>' if elf_data == ELFDATA2MSB else '<'
+    if elf_class == ELFCLASS64:
+        formats = ['HHIQQQIHHHHHH', 'IIQQQQIIQQ', 'IIQQQQQQ', 'qQ', 'IBBHQQ']
+    else:
+        formats = ['HHIIIIIHHHHHH', 'IIIIIIIIII', 'IIIIIIII', 'iI', 'IIIBBH']
+    return [struct.Struct(endian + fmt) for fmt in formats]
+
+def read_elf_header(buffer):
+    """Parse the ELF header at the start of buffer, or return None if it isn't one."""
+    if len(buffer) < 52 or buffer[:4] != ELF_MAGIC:
+        return None
+    elf_class, elf_data = buffer[4], buffer[5]
+    header_format, section_format, segment_format, dynamic_format, symbol_format = _elf_formats(elf_class, elf_data)
+    if len(buffer) < 16 + header_format.size:
+        return None
+    (e_type, e_machine, _, e_entry, e_phoff, e_shoff, e_flags, _, e_phentsize, e_phnum,
+     e_shentsize, e_shnum, e_shstrndx) = header_format.unpack_from(buffer, 16)
+    return {
+        'class': elf_class,
+        'data': elf_data,
+        'type': e_type,
+        'machine': e_machine,
+        'entry': e_entry,
+        'flags': e_flags,
+        'phoff': e_phoff,
+        'phentsize': e_phentsize,
+        'phnum': e_phnum,
+        'shoff': e_shoff,
+        'shentsize': e_shentsize,
+        'shnum': e_shnum,
+        'shstrndx': e_shstrndx,
+        'section_format': section_format,
+        'segment_format': segment_format,
+        'dynamic_format': dynamic_format,
+        'symbol_format': symbol_format,
+    }
+
+def _c_string(buffer, offset):
+    end = buffer.find(b'\0', offset)
+    return bytes(buffer[offset:end if end != -1 else len(buffer)]).decode('latin-1')
+
+def read_elf_sections(buffer, header):
+    """Return the section table as a list of dicts, skipping entries outside the file."""
+    section_format = header['section_format']
+    if not header['shoff'] or header['shentsize'] < section_format.size:
+        return []
+    sections = []
+    for index in range(header['shnum']):
+        position = header['shoff'] + index * header['shentsize']
+        if position + section_format.size > len(buffer):
+            break
+        (sh_name, sh_type, sh_flags, sh_addr, sh_offset, sh_size, sh_link, sh_info,
+         _, sh_entsize) = section_format.unpack_from(buffer, position)
+        sections.append({
+            'name_offset': sh_name,
+            'type': sh_type,
+            'flags': sh_flags,
+            'addr': sh_addr,
+            'offset': sh_offset,
+            'size': sh_size,
+            'link': sh_link,
+            'info': sh_info,
+            'entsize': sh_entsize,
+        })
+
+    names = sections[header['shstrndx']] if header['shstrndx'] < len(sections) else None
+    for section in sections:
+        section['name'] = ''
+        if names and names['offset'] + section['name_offset'] < len(buffer):
+            section['name'] = _c_string(buffer, names['offset'] + section['name_offset'])
+    return sections
+
+def read_elf_segments(buffer, header):
+    """Return the program header table as a list of dicts, skipping entries outside the file."""
+    segment_format = header['segment_format']
+    if not header['phoff'] or header['phentsize'] < segment_format.size:
+        return []
+    segments = []
+    for index in range(header['phnum']):
+        position = header['phoff'] + index * header['phentsize']
+        if position + segment_format.size > len(buffer):
+            break
+        fields = segment_format.unpack_from(buffer, position)
+        if header['class'] == ELFCLASS64:
+            p_type, _, p_offset, p_vaddr, _, p_filesz, _, _ = fields
+        else:
+            p_type, p_offset, p_vaddr, _, p_filesz, _, _, _ = fields
+        segments.append({'type': p_type, 'offset': p_offset, 'vaddr': p_vaddr, 'filesz': p_filesz})
+    return segments
+
+# Dynamic section tags, symbol fields and note types read by parse_elf_metadata
+DT_NULL = 0
+DT_NEEDED = 1
+DT_HASH = 4
+DT_STRTAB = 5
+DT_SYMTAB = 6
+DT_STRSZ = 10
+DT_SONAME = 14
+DT_RPATH = 15
+DT_RUNPATH = 29
+DT_GNU_HASH = 0x6ffffef5
+SYMBOL_TYPES = {0: 'NOTYPE', 1: 'OBJECT', 2: 'FUNC', 3: 'SECTION', 4: 'FILE', 5: 'COMMON', 6: 'TLS', 10: 'IFUNC'}
+SYMBOL_BINDS = {0: 'LOCAL', 1: 'GLOBAL', 2: 'WEAK', 10: 'UNIQUE'}
+NT_GNU_BUILD_ID = 3
+
+def _vaddr_to_offset(segments, vaddr):
+    for segment in segments:
+        if segment['type'] == PT_LOAD and segment['vaddr'] <= vaddr < segment['vaddr'] + segment['filesz']:
+            return vaddr - segment['vaddr'] + segment['offset']
+    return None
+
+def _read_dynamic(buffer, header, offset, size):
+    dynamic_format = header['dynamic_format']
+    entries = []
+    end = min(offset + size, len(buffer))
+    for position in range(offset, end - dynamic_format.size + 1, dynamic_format.size):
+        tag, value = dynamic_format.unpack_from(buffer, position)
+        if tag == DT_NULL:
+            break
+        entries.append((tag, value))
+    return entries
+
+def _read_symbols(buffer, header, offset, count, strtab):
+    symbol_format = header['symbol_format']
+    symbols = []
+    count = min(count, (len(buffer) - offset) // symbol_format.size)
+    # Entry 0 is always the reserved undefined symbol
+    for index in range(1, count):
+        fields = symbol_format.unpack_from(buffer, offset + index * symbol_format.size)
+        if header['class'] == ELFCLASS64:
+            st_name, st_info, _, st_shndx, st_value, st_size = fields
+        else:
+            st_name, st_value, st_size, st_info, _, st_shndx = fields
+        symbols.append({
+            'name': _c_string(buffer, strtab + st_name) if strtab + st_name < len(buffer) else '',
+            'type': SYMBOL_TYPES.get(st_info & 0xf, str(st_info & 0xf)),
+            'bind': SYMBOL_BINDS.get(st_info >> 4, str(st_info >> 4)),
+            'defined': st_shndx != 0,
+            'value': st_value,
+            'size': st_size,
+        })
+    return symbols
+
+def _symbol_count(buffer, header, segments, tags):
+    """Number of dynamic symbols, from DT_HASH or DT_GNU_HASH, for images without sections."""
+    endian = '>' if header['data'] == ELFDATA2MSB else '<'
+    if DT_HASH in tags:
+        hash_table = _vaddr_to_offset(segments, tags[DT_HASH])
+        if hash_table is not None and hash_table + 8 <= len(buffer):
+            return struct.unpack_from(endian + 'II', buffer, hash_table)[1]  # nchain
+    if DT_GNU_HASH in tags:
+        hash_table = _vaddr_to_offset(segments, tags[DT_GNU_HASH])
+        if hash_table is None or hash_table + 16 > len(buffer):
+            return 0
+        nbuckets, symoffset, bloom_size, _ = struct.unpack_from(endian + 'IIII', buffer, hash_table)
+        buckets = hash_table + 16 + bloom_size * (8 if header['class'] == ELFCLASS64 else 4)
+        chains = buckets + 4 * nbuckets
+        if chains > len(buffer):
+            return 0
+        last = max(struct.unpack_from(endian + '%dI' % nbuckets, buffer, buckets), default=0)
+        if last < symoffset:
+            return symoffset
+        # Walk the last bucket's chain to the entry with the end marker bit set
+        position = chains + 4 * (last - symoffset)
+        while position + 4 <= len(buffer) and not struct.unpack_from(endian + 'I', buffer, position)[0] & 1:
+            position += 4
+            last += 1
+        return last + 1
+    return 0
+
+def _read_build_id(buffer, header, offset, size):
+    endian = '>' if header['data'] == ELFDATA2MSB else '<'
+    end = min(offset + size, len(buffer))
+    while offset + 12 <= end:
+        namesz, descsz, note_type = struct.unpack_from(endian + 'III', buffer, offset)
+        name_start = offset + 12
+        desc_start = name_start + (namesz + 3 & ~3)
+        if note_type == NT_GNU_BUILD_ID and bytes(buffer[name_start:name_start + namesz]) == b'GNU\0':
+            return bytes(buffer[desc_start:desc_start + descsz]).hex()
+        offset = desc_start + (descsz + 3 & ~3)
+    return None
+
+def parse_elf_metadata(buffer):
+    """Read linking metadata from an ELF image held in buffer (bytes or mmap).
+
+    Returns a dict with the NEEDED libraries, SONAME, RPATH and RUNPATH
+    entries, dynamic symbols and GNU build-id, or None if buffer isn't ELF.
+    Section headers are used when present; stripped images fall back to the
+    program headers.
+    """
+    header = read_elf_header(buffer)
+    if not header:
+        return None
+    sections = read_elf_sections(buffer, header)
+    segments = read_elf_segments(buffer, header)
+    metadata = {
+        'class': 64 if header['class'] == ELFCLASS64 else 32,
+        'endian': 'big' if header['data'] == ELFDATA2MSB else 'little',
+        'machine': header['machine'],
+        'needed': [],
+        'soname': None,
+        'rpath': [],
+        'runpath': [],
+        'symbols': [],
+        'build_id': None,
+    }
+
+    # Dynamic table and the string table its names live in
+    dynamic_section = next((section for section in sections if section['type'] == SHT_DYNAMIC), None)
+    dynamic_segment = next((segment for segment in segments if segment['type'] == PT_DYNAMIC), None)
+    if dynamic_section:
+        entries = _read_dynamic(buffer, header, dynamic_section['offset'], dynamic_section['size'])
+    elif dynamic_segment:
+        entries = _read_dynamic(buffer, header, dynamic_segment['offset'], dynamic_segment['filesz'])
+    else:
+        entries = []
+    tags = dict(entries)
+    strtab = None
+    if dynamic_section and dynamic_section['link'] < len(sections):
+        strtab = sections[dynamic_section['link']]['offset']
+    elif DT_STRTAB in tags:
+        strtab = _vaddr_to_offset(segments, tags[DT_STRTAB])
+
+    if strtab is not None:
+        for tag, value in entries:
+            if strtab + value >= len(buffer):
+                continue
+            if tag == DT_NEEDED:
+                metadata['needed'].append(_c_string(buffer, strtab + value))
+            elif tag == DT_SONAME:
+                metadata['soname'] = _c_string(buffer, strtab + value)
+            elif tag == DT_RPATH:
+                metadata['rpath'].extend(_c_string(buffer, strtab + value).split(':'))
+            elif tag == DT_RUNPATH:
+                metadata['runpath'].extend(_c_string(buffer, strtab + value).split(':'))
+
+    # Dynamic symbols; without section headers the hash table gives the count
+    dynsym = next((section for section in sections if section['type'] == SHT_DYNSYM), None)
+    if dynsym and dynsym['link'] < len(sections):
+        metadata['symbols'] = _read_symbols(buffer, header, dynsym['offset'],
+                                            dynsym['size'] // header['symbol_format'].size,
+                                            sections[dynsym['link']]['offset'])
+    elif strtab is not None and DT_SYMTAB in tags:
+        symtab = _vaddr_to_offset(segments, tags[DT_SYMTAB])
+        if symtab is not None:
+            metadata['symbols'] = _read_symbols(buffer, header, symtab,
+                                                _symbol_count(buffer, header, segments, tags), strtab)
+
+    notes = [(section['offset'], section['size']) for section in sections if section['type'] == SHT_NOTE]
+    if not notes:
+        notes = [(segment['offset'], segment['filesz']) for segment in segments if segment['type'] == PT_NOTE]
+    for offset, size in notes:
+        metadata['build_id'] = _read_build_id(buffer, header, offset, size)
+        if metadata['build_id']:
+            break
+    return metadata
+
+def read_elf_metadata(file_path):
+    """Map file_path and return parse_elf_metadata for it (None if not ELF)."""
+    with map_file(file_path) as image:
+        return parse_elf_metadata(image)
+
+# e_machine values we can hand to capstone
+EM_386 = 3
+EM_MIPS = 8
+EM_PPC = 20
+EM_PPC64 = 21
+EM_ARM = 40
+EM_X86_64 = 62
+EM_AARCH64 = 183
+EF_MIPS_MICROMIPS = 0x02000000
+EF_MIPS_ARCH = 0xf0000000
+EF_MIPS_ARCH_32R6 = 0x90000000
+EF_MIPS_ARCH_64R6 = 0xa0000000
+
+def capstone_target(header):
+    """Pick the capstone (arch, mode) for an ELF header, or None if unsupported."""
+    machine, flags = header['machine'], header['flags']
+    is_64 = header['class'] == ELFCLASS64
+    endian = CS_MODE_BIG_ENDIAN if header['data'] == ELFDATA2MSB else CS_MODE_LITTLE_ENDIAN
+    if machine == EM_386:
+        return CS_ARCH_X86, CS_MODE_32
+    if machine == EM_X86_64:
+        return CS_ARCH_X86, CS_MODE_64
+    if machine == EM_ARM:
+        # An odd entry point means the program starts in Thumb state
+        return CS_ARCH_ARM, (CS_MODE_THUMB if header['entry'] & 1 else CS_MODE_ARM) | endian
+    if machine == EM_AARCH64:
+        return CS_ARCH_ARM64, CS_MODE_ARM | endian
+    if machine == EM_MIPS:
+        if flags & EF_MIPS_MICROMIPS:
+            mode = CS_MODE_MICRO
+        elif flags & EF_MIPS_ARCH in (EF_MIPS_ARCH_32R6, EF_MIPS_ARCH_64R6):
+            mode = CS_MODE_MIPS32R6
+        else:
+            mode = CS_MODE_MIPS64 if is_64 else CS_MODE_MIPS32
+        return CS_ARCH_MIPS, mode | endian
+    if machine in (EM_PPC, EM_PPC64):
+        return CS_ARCH_PPC, (CS_MODE_64 if is_64 else CS_MODE_32) | endian
+    return None
+
 # Function to disassemble code sections using capstone
 def disassemble_code(file_path):
+    """Yield "address:\tmnemonic\top_str" lines for the executable sections of an ELF file.
+
+    The architecture and mode come from the ELF header, and instructions are
+    produced lazily one section at a time. Non-ELF and unsupported files yield
+    nothing.
+    """
     try:
-        with open(file_path, 'rb') as f:
-            code = f.read()
-        # Only try to disassemble if file seems to contain code
-        if any(binary in code for binary in [b'\x7fELF', b'\x7FELF']):
-            md = Cs(CS_ARCH_ARM, CS_MODE_ARM)
-            disassembled = []
-            for i in md.disasm(code, 0x1000):
-                disassembled.append(f"0x{i.address:x}:\t{i.mnemonic}\t{i.op_str}")
-            return disassembled
-        return []
+        with map_file(file_path) as code:
+            yield from disassemble_buffer(code)
     except Exception as e:
         print(f"Note: Couldn't disassemble {file_path}: {str(e)}")
-        return []
 
-def is_binary_file(file_path):
-    """Check if file is binary."""
-    try:
-        with open(file_path, 'tr') as check_file:
-            check_file.read(1024)
-            return False
-    except:
-        return True
+def disassemble_buffer(code):
+    """disassemble_code over an ELF image already in memory (bytes or an mmap)"""
+    header = read_elf_header(code)
+    target = capstone_target(header) if header else None
+    if not target:
+        return
+    md = Cs(*target)
+    md.skipdata = True  # step over literal pools instead of stopping at them
+    for section in read_elf_sections(code, header):
+        if not section['flags'] & SHF_EXECINSTR or section['type'] == SHT_NOBITS:
+            continue
+        data = code[section['offset']:section['offset'] + section['size']]
+        for address, _, mnemonic, op_str in md.disasm_lite(data, section['addr']):
+            yield f"0x{address:x}:\t{mnemonic}\t{op_str}"
 
 @lru_cache(maxsize=1000)
 async def fetch_nvd_vulnerabilities(component=None):
@@ -258,46 +1251,73 @@ async def fetch_nvd_vulnerabilities(component=None):
                 return data
     return None
 
-def detect_zero_day_patterns(binary_data, strings_found):
+ENTROPY_BLOCK_SIZE = 256
+# Bytes histogrammed per bincount call, bounding the index array's size
+ENTROPY_BATCH_BYTES = 4 * 1024 * 1024
+
+def entropy_map(buffer, block_size=ENTROPY_BLOCK_SIZE):
+    """Return the Shannon entropy (bits per byte, 0-8) of each block of buffer.
+
+    buffer can be bytes, an mmap or any other bytes-like object; it is viewed
+    in place, never copied. The result is a float32 array with one value per
+    block, the last block covering whatever is left over.
+    """
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    full_blocks = len(data) // block_size
+    entropies = np.empty(full_blocks + (len(data) % block_size > 0), dtype=np.float32)
+
+    # Count every block's byte values with one bincount per batch: offsetting
+    # block i's bytes by 256*i gives each block its own run of 256 bins
+    rows = max(1, ENTROPY_BATCH_BYTES // block_size)
+    for first in range(0, full_blocks, rows):
+        count = min(rows, full_blocks - first)
+        blocks = data[first * block_size:(first + count) * block_size].reshape(count, block_size)
+        bins = blocks + (np.arange(count, dtype=np.int64) * 256)[:, None]
+        histograms = np.bincount(bins.ravel(), minlength=count * 256).reshape(count, 256)
+        entropies[first:first + count] = _histogram_entropy(histograms, block_size)
+
+    if len(entropies) > full_blocks:
+        tail = data[full_blocks * block_size:]
+        entropies[-1] = _histogram_entropy(np.bincount(tail, minlength=256)[None, :], len(tail))[0]
+    return entropies
+
+def _histogram_entropy(histograms, total):
+    # H = log2(n) - sum(c * log2(c)) / n over each row's nonzero counts c
+    counts = histograms.astype(np.float64)
+    logs = np.zeros_like(counts)
+    np.log2(counts, out=logs, where=counts > 0)
+    return np.log2(total) - (counts * logs).sum(axis=1) / total
+
+def detect_zero_day_patterns(binary_data, strings_found, block_size=ENTROPY_BLOCK_SIZE):
     """Detect potential zero-day vulnerabilities using statistical analysis"""
     indicators = []
     
     # Calculate entropy distribution
-    chunk_size = 256
-    chunks = [binary_data[i:i+chunk_size] for i in range(0, len(binary_data), chunk_size)]
-    entropies = [calculate_entropy(chunk) for chunk in chunks]
+    entropies = entropy_map(binary_data, block_size)
     
     # Detect anomalous patterns
-    mean_entropy = np.mean(entropies)
-    std_entropy = np.std(entropies)
-    
-    for i, entropy in enumerate(entropies):
-        if entropy > mean_entropy + 2 * std_entropy:
+    if len(entropies):
+        mean_entropy = entropies.mean()
+        std_entropy = entropies.std()
+        
+        for i in np.flatnonzero(entropies > mean_entropy + 2 * std_entropy):
             indicators.append({
                 'type': 'Potential Zero-day',
                 'confidence': 'HIGH',
-                'details': f'Anomalous entropy pattern at offset {i*chunk_size}',
-                'entropy': entropy
+                'details': f'Anomalous entropy pattern at offset {i*block_size}',
+                'entropy': float(entropies[i])
             })
     
     # Analyze string patterns for potential exploits
-    exploit_patterns = [
-        (r'(?i)overflow', 0.9),
-        (r'(?i)race\s*condition', 0.85),
-        (r'(?i)use\s*after\s*free', 0.9),
-        (r'(?i)double\s*free', 0.9),
-        (r'(?i)memory\s*corruption', 0.85)
-    ]
-    
     for string in strings_found:
-        for pattern, confidence in exploit_patterns:
-            if re.search(pattern, string):
-                indicators.append({
-                    'type': 'Potential Zero-day',
-                    'confidence': confidence,
-                    'details': f'Possible exploit pattern: {string[:100]}',
-                    'pattern': pattern
-                })
+        for _, index in EXPLOIT_ENGINE.matching_rules(string):
+            pattern, confidence = EXPLOIT_PATTERNS[index]
+            indicators.append({
+                'type': 'Potential Zero-day',
+                'confidence': confidence,
+                'details': f'Possible exploit pattern: {string[:100]}',
+                'pattern': pattern
+            })
     
     return indicators
 
@@ -312,176 +1332,880 @@ def load_local_vulnerability_database():
         pass
     return {}
 
-def check_password_file(file_path):
-    """Analyze potential password files for weak/default credentials"""
+PASSWORD_FILES = ['passwd', 'shadow', 'passwd.bak', 'shadow.bak']
+
+def is_password_path(file_path):
+    """Check if a path names a file check_password_file should parse"""
+    return any(pfile in file_path.lower() for pfile in PASSWORD_FILES)
+
+def check_password_file(file_path, content=None):
+    """Analyze potential password files for weak/default credentials
+
+    content optionally holds the file's bytes (or an mmap of them) so the
+    file is not read again.
+    """
     vulnerabilities = []
-    password_files = ['passwd', 'shadow', 'passwd.bak', 'shadow.bak']
 
-    if any(pfile in file_path.lower() for pfile in password_files):
+    if is_password_path(file_path):
         try:
-            with open(file_path, 'r', errors='ignore') as f:
-                content = f.read()
-                # Parse each line of the password file
-                for line_num, line in enumerate(content.splitlines(), 1):
-                    if not line.strip():
-                        continue
-                    parts = line.split(':')
-                    if len(parts) >= 2:
-                        username = parts[0]
-                        password = parts[1]
-        
-                        # Check for various credential patterns
-                        if username == 'admin':
-                            vulns = {
-                                '': 'Empty admin password',
-                                'admin': 'Default admin:admin credentials',
-                                '1234': 'Default TP-Link credentials (admin/1234)',
-                                '$1$': 'MD5 hashed admin password'
-                            }
-                            for pwd, desc in vulns.items():
-                                if pwd in password:
-                                    vulnerabilities.append({
-                                        "type": "Default/Weak Credentials",
-                                        "file": os.path.basename(file_path),
-                                        "line": line_num,
-                                        "match": f"{desc} - Found '{username}:{password}'",
-                                        "severity": "HIGH"
-                                    })
-                        
-                        # Check for empty root password
-                        if username == 'root' and not password:
-                            vulnerabilities.append({
-                                "type": "Default/Weak Credentials",
-                                "file": os.path.basename(file_path),
-                                "line": line_num,
-                                "match": f"Empty root password - Found '{username}:{password}'",
-                                "severity": "HIGH"
-                            })
-                        
-                        # Check for known weak passwords
-                        if password in ['', 'root', 'admin', '1234', 'password']:
-                            vulnerabilities.append({
-                                "type": "Default/Weak Credentials",
-                                "file": os.path.basename(file_path),
-                                "line": line_num,
-                                "match": f"Weak password for user '{username}' - Found '{username}:{password}'",
-                                "severity": "HIGH"
-                            })
+            if content is None:
+                with open(file_path, 'r', errors='ignore') as f:
+                    content = f.read()
+            else:
+                content = bytes(content).decode('utf-8', errors='ignore')
+            # Parse each line of the password file
+            for line_num, line in enumerate(content.splitlines(), 1):
+                if not line.strip():
+                    continue
+                parts = line.split(':')
+                if len(parts) >= 2:
+                    username = parts[0]
+                    password = parts[1]
+    
+                    # Check for various credential patterns
+                    if username == 'admin':
+                        vulns = {
+                            '': 'Empty admin password',
+                            'admin': 'Default admin:admin credentials',
+                            '1234': 'Default TP-Link credentials (admin/1234)',
+                            '$1$': 'MD5 hashed admin password'
+                        }
+                        for pwd, desc in vulns.items():
+                            if pwd in password:
+                                vulnerabilities.append({
+                                    "type": "Default/Weak Credentials",
+                                    "file": os.path.basename(file_path),
+                                    "line": line_num,
+                                    "match": f"{desc} - Found '{username}:{password}'",
+                                    "severity": "HIGH"
+                                })
+                    
+                    # Check for empty root password
+                    if username == 'root' and not password:
+                        vulnerabilities.append({
+                            "type": "Default/Weak Credentials",
+                            "file": os.path.basename(file_path),
+                            "line": line_num,
+                            "match": f"Empty root password - Found '{username}:{password}'",
+                            "severity": "HIGH"
+                        })
+                    
+                    # Check for known weak passwords
+                    if password in ['', 'root', 'admin', '1234', 'password']:
+                        vulnerabilities.append({
+                            "type": "Default/Weak Credentials",
+                            "file": os.path.basename(file_path),
+                            "line": line_num,
+                            "match": f"Weak password for user '{username}' - Found '{username}:{password}'",
+                            "severity": "HIGH"
+                        })
         except Exception as e:
             print(f"Error analyzing password file {file_path}: {e}")
     
     return vulnerabilities
 
+# Shortest literal worth gating a rule on; rules with shorter anchors always run
+MIN_ANCHOR_LENGTH = 3
+# Bytes lowercased at a time by the gate, bounding the copy made per scan
+GATE_WINDOW = 1024 * 1024
+# Longest match the content rules report; longer ones are binary garbage
+MAX_MATCH_LENGTH = 200
+
+def _literal_prefixes(items):
+    """Return (prefixes, complete) for a parsed regex sequence.
+
+    prefixes is the set of literal strings every match must start with (None
+    when the sequence does not start with a literal), complete is True when the
+    whole sequence is literal so callers can keep extending the prefixes.
+    """
+    prefixes, complete = {''}, True
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            ext, ext_complete = {chr(av)}, True
+        elif op is sre_parse.SUBPATTERN:
+            ext, ext_complete = _literal_prefixes(av[-1])
+        elif op is sre_parse.BRANCH:
+            results = [_literal_prefixes(branch) for branch in av[1]]
+            if any(r[0] is None for r in results):
+                ext, ext_complete = None, False
+            else:
+                ext = set().union(*(r[0] for r in results))
+                ext_complete = all(r[1] for r in results)
+        else:
+            ext, ext_complete = None, False
+        if not ext:
+            complete = False
+            break
+        prefixes = {p + e for p in prefixes for e in ext}
+        if not ext_complete:
+            complete = False
+            break
+    if '' in prefixes:
+        return None, False
+    return prefixes, complete
+
+def _longest_literal(items):
+    """Return the longest run of top-level literals in a parsed regex sequence."""
+    best, run = '', ''
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            run += chr(av)
+            best = max(best, run, key=len)
+        else:
+            run = ''
+    return best
+
+def _lower(buffer):
+    """Lowercase a buffer without changing its length so offsets stay valid."""
+    if isinstance(buffer, str):
+        lowered = buffer.lower()
+        if len(lowered) != len(buffer):
+            lowered = ''.join(c.lower() if len(c.lower()) == 1 else c for c in buffer)
+        return lowered
+    return bytes(buffer).lower()
+
+class RuleEngine:
+    """Match a table of regex rules against a buffer in a single pass.
+
+    The table maps a category to a list of patterns, the same shape the
+    detectors have always used. Every pattern is compiled once, and the literal
+    text each rule must start with (its anchor) is gathered into one gate
+    regex. A scan runs the gate once over a lowercased copy of the buffer and
+    only tries the rules whose anchors were seen, at the offsets they were seen.
+    Rules without a leading literal fall back to a full pass, but only when a
+    literal they require appears somewhere in the buffer.
+    """
+
+    def __init__(self, rule_table, flags=0):
+        self.rules = []
+        self.compiled_bytes = {}
+        self.leading = {}    # anchor -> rules that must match starting at the anchor
+        self.floating = {}   # anchor -> rules that contain the anchor somewhere
+        self.always = []     # rules with no usable anchor
+        self.max_width = 0   # longest match any rule can report, capped at MAX_MATCH_LENGTH
+        self.min_width = MAX_MATCH_LENGTH  # shortest match any rule can report
+        for category, patterns in rule_table.items():
+            for index, pattern in enumerate(patterns):
+                rule_id = (category, index)
+                compiled = re.compile(pattern, flags)
+                self.rules.append((rule_id, compiled))
+                self.compiled_bytes[rule_id] = re.compile(pattern.encode('latin-1'), flags)
+                parsed = sre_parse.parse(pattern, flags)
+                self.max_width = max(self.max_width, min(parsed.getwidth()[1], MAX_MATCH_LENGTH))
+                self.min_width = min(self.min_width, max(parsed.getwidth()[0], 1))
+                prefixes, _ = _literal_prefixes(parsed)
+                if prefixes and min(map(len, prefixes)) >= MIN_ANCHOR_LENGTH:
+                    for prefix in prefixes:
+                        self.leading.setdefault(prefix.lower(), []).append(rule_id)
+                    continue
+                literal = _longest_literal(parsed)
+                if len(literal) >= MIN_ANCHOR_LENGTH:
+                    self.floating.setdefault(literal.lower(), []).append(rule_id)
+                else:
+                    self.always.append(rule_id)
+        self.compiled = dict(self.rules)
+        self.order = {rule_id: i for i, (rule_id, _) in enumerate(self.rules)}
+
+        # Longest anchors first so the gate reports the longest anchor at each
+        # offset; every shorter anchor starting there is one of its prefixes.
+        anchors = sorted(set(self.leading) | set(self.floating), key=len, reverse=True)
+        self.triggers = {}
+        for anchor in anchors:
+            shorter = [a for a in anchors if anchor.startswith(a)]
+            self.triggers[anchor] = (
+                [r for a in shorter for r in self.leading.get(a, [])],
+                [r for a in shorter for r in self.floating.get(a, [])]
+            )
+        self.max_anchor = max(map(len, anchors), default=1)
+        gate = '|'.join(re.escape(a) for a in anchors) or '(?!)'
+        self.gate = re.compile(gate)
+        self.gate_bytes = re.compile(gate.encode('latin-1'))
+
+    def scan(self, buffer, resume=None):
+        """Return every rule match in buffer as (rule_id, start, end) tuples.
+
+        buffer may be a str or any bytes-like object, including an mmap or a
+        memoryview; bytes are matched with the bytes form of each rule and are
+        never decoded. Matches come back grouped in rule table order and sorted
+        by offset within each rule, exactly as running each pattern's finditer
+        in turn. resume optionally maps a rule id to the offset its matching
+        starts from, to carry on a scan that ended in the previous window.
+        """
+        if isinstance(buffer, str):
+            gate, compiled = self.gate, self.compiled
+        else:
+            gate, compiled = self.gate_bytes, self.compiled_bytes
+        found = {}
+        last_end = dict(resume or {})
+        run_full = set(self.always)
+
+        # The gate runs over a lowercased copy of one window at a time; each
+        # window overlaps the next by enough to catch anchors spanning the edge.
+        size = len(buffer)
+        for window_start in range(0, size, GATE_WINDOW):
+            limit = min(GATE_WINDOW, size - window_start)
+            lowered = _lower(buffer[window_start:window_start + limit + self.max_anchor - 1])
+            pos = 0
+            while True:
+                hit = gate.search(lowered, pos)
+                if not hit or hit.start() >= limit:
+                    break
+                start = window_start + hit.start()
+                anchor = hit.group()
+                if isinstance(anchor, bytes):
+                    anchor = anchor.decode('latin-1')
+                leading, floating = self.triggers[anchor]
+                run_full.update(floating)
+                for rule_id in leading:
+                    if start < last_end.get(rule_id, 0):
+                        continue
+                    match = compiled[rule_id].match(buffer, start)
+                    if match:
+                        found.setdefault(rule_id, []).append((match.start(), match.end()))
+                        last_end[rule_id] = match.end()
+                pos = hit.start() + 1
+
+        for rule_id in run_full:
+            found[rule_id] = [(m.start(), m.end())
+                              for m in compiled[rule_id].finditer(buffer, last_end.get(rule_id, 0))]
+
+        return [(rule_id, start, end)
+                for rule_id in sorted(found, key=self.order.get)
+                for start, end in found[rule_id]]
+
+    def match(self, rule_id, buffer, start):
+        """Re-run one rule at an offset scan reported, for callers that need its groups"""
+        compiled = self.compiled if isinstance(buffer, str) else self.compiled_bytes
+        return compiled[rule_id].match(buffer, start)
+
+    def matching_rules(self, buffer):
+        """Return the ids of the rules that match anywhere in buffer, in table order."""
+        return sorted({rule_id for rule_id, _, _ in self.scan(buffer)}, key=self.order.get)
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton for case-insensitive plain keyword tables.
+
+    Takes the same {category: [keyword, ...]} shape as RuleEngine and finds
+    every keyword in one left-to-right pass. Keyword ids are (category, index)
+    and are numbered in table order.
+    """
+
+    def __init__(self, keyword_table):
+        self.keywords = [(category, index)
+                         for category, keywords in keyword_table.items()
+                         for index in range(len(keywords))]
+        words = [keyword.lower() for keywords in keyword_table.values() for keyword in keywords]
+        alphabet = sorted(set(''.join(words)))
+
+        # Trie of all keywords, then completed into a DFA breadth first so a
+        # scan never has to follow failure links
+        goto = [{}]
+        output = [set()]
+        for number, word in enumerate(words):
+            state = 0
+            for char in word:
+                if char not in goto[state]:
+                    goto[state][char] = len(goto)
+                    goto.append({})
+                    output.append(set())
+                state = goto[state][char]
+            output[state].add(number)
+
+        fail = [0] * len(goto)
+        delta = [None] * len(goto)
+        delta[0] = {char: goto[0].get(char, 0) for char in alphabet}
+        queue = list(goto[0].values())
+        for state in queue:
+            delta[state] = dict(delta[fail[state]], **goto[state])
+            output[state] |= output[fail[state]]
+            for char, child in goto[state].items():
+                fail[child] = delta[fail[state]][char] if state else 0
+                queue.append(child)
+
+        self.delta = delta
+        self.output = [tuple(sorted(numbers)) for numbers in output]
+        # Any character outside the keywords' alphabet sends the DFA back to
+        # the root, so only runs of alphabet characters need to be stepped
+        self.runs = re.compile('[%s]{%d,}' % (re.escape(''.join(alphabet)), min(map(len, words))))
+
+    def _step(self, word):
+        delta, output = self.delta, self.output
+        state = 0
+        for position, char in enumerate(word, 1):
+            state = delta[state][char]
+            for number in output[state]:
+                yield number, position
+
+    def scan(self, text):
+        """Yield (keyword number, end offset) for every keyword occurrence in text."""
+        # Disassembly repeats the same mnemonics and registers over and over,
+        # so each distinct run is stepped through the DFA only once
+        stepped = {}
+        for run in self.runs.finditer(_lower(text)):
+            word = run.group()
+            found = stepped.get(word)
+            if found is None:
+                found = stepped[word] = tuple(self._step(word))
+            for number, end in found:
+                yield number, run.start() + end
+
+# Enhanced patterns for IoT firmware analysis
+CONTENT_PATTERNS = {
+    'hardcoded_creds': [
+        # More specific password pattern to avoid normal text like "Please enter your password"
+        r'(?i)(?:password|passwd)\s*[=:]\s*[\'"]([^\'"]{3,})[\'""]',
+        r'(?i)(?:username|user|login)\s*[=:]\s*[\'"]([^\'"]{3,})[\'""]',
+        r'(?i)(?:pass|pwd)\s*[=:]\s*[\'"]([^\'"]{3,})[\'""]',
+        r'(?i)admin_pass(?:word)?\s*[=:]\s*[\'"]([^\'"]{3,})[\'""]',
+        r'(?i)api_key\s*[=:]\s*[\'"]([^\'"]{8,})[\'""]',
+        r'(?i)(?:secret|token)\s*[=:]\s*[\'"]([^\'"]{8,})[\'""]',
+        # More specific config-style patterns
+        r'(?i)define\s+[\'"]?(?:PASSWORD|PASS|PWD)[\'"]?\s+[\'"]([^\'"]{3,})[\'"]'
+    ],
+    'command_injection': [
+        r'system\s*\([^)]+\)',
+        r'exec\s*\([^)]+\)',
+        r'popen\s*\([^)]+\)',
+        r'shell_exec\s*\([^)]+\)',
+        r'eval\s*\([^)]+\)'
+    ],
+    'dangerous_functions': [
+        r'strcpy\s*\(',
+        r'strcat\s*\(',
+        r'gets\s*\(',
+        r'scanf\s*\([^)]*%s[^)]*\)',
+        r'printf\s*\([^)]*%n[^)]*\)'
+    ],
+    'dangerous_config': [
+        r'(?i)debug\s*[=:]\s*(true|1|yes)',
+        r'(?i)auth\s*[=:]\s*(false|0|no)',
+        r'(?i)ssl_verify\s*[=:]\s*(false|0|no)',
+        r'(?i)check_cert\s*[=:]\s*(false|0|no)'
+    ],
+    'dangerous_libs': [
+        r'lib([a-z]+)[.-]([0-9.]+)',
+        r'([a-z]+)_version[=: ]+["\']?([0-9.]+)',
+        r'VERSION[=: ]+["\']?([0-9.]+)',
+        r'([a-z-]+) version ([0-9.]+)',
+        r'([a-z-]+)-([0-9.]+)\.so'
+    ],
+    'unsafe_libs': [
+        r'telnetd',
+        r'ftpd',
+        r'/bin/ash',
+        r'/bin/dash',
+        r'libcrypt\.so\.[0-9]',
+        r'libssl\.so\.[0-9]',
+        r'libcrypto\.so\.[0-9]'
+    ],
+    'dangerous_services': [
+        r'telnet\s+stream\s+tcp\s+nowait',
+        r'ftp\s+stream\s+tcp\s+nowait',
+        r'rsh\s+stream\s+tcp\s+nowait',
+        r'/etc/init.d/(telnet|ftp|rsh)',
+        r'inetd\.conf'
+    ],
+    'password_files': [
+        r'/etc/passwd[\w.]*',
+        r'/etc/shadow[\w.]*',
+        r'password[._-]?backup',
+        r'\.htpasswd'
+    ]
+}
+
+# Imported functions that stand in for the text rules of the same category in
+# ELF binaries, where those rules mostly match string constants
+SYMBOL_RULES = {
+    'command_injection': ['system', 'popen', 'execl', 'execlp', 'execle', 'execv', 'execvp', 'execve'],
+    'dangerous_functions': ['strcpy', 'strcat', 'gets']
+}
+
+EXPLOIT_PATTERNS = [
+    (r'(?i)overflow', 0.9),
+    (r'(?i)race\s*condition', 0.85),
+    (r'(?i)use\s*after\s*free', 0.9),
+    (r'(?i)double\s*free', 0.9),
+    (r'(?i)memory\s*corruption', 0.85)
+]
+
+DISASSEMBLY_KEYWORDS = {
+    'unsafe_funcs': [
+        'strcpy', 'strcat', 'gets', 'sprintf', 'scanf',
+        'system', 'exec', 'popen', 'shell_exec'
+    ],
+    'dangerous_ops': [
+        'password', 'admin', 'root', 'shell', 'auth',
+        'key', 'cred', 'secret'
+    ]
+}
+
+# Compiled once per process and shared by every detector
+EXPLOIT_ENGINE = RuleEngine({'exploit': [pattern for pattern, _ in EXPLOIT_PATTERNS]})
+DISASSEMBLY_AUTOMATON = KeywordAutomaton(DISASSEMBLY_KEYWORDS)
+
 def get_dangerous_libs():
-    """Return dictionary of known dangerous library versions"""
+    """Return dictionary of known dangerous library versions.
+
+    affected_versions lists [first, end) ranges: a detected version is
+    dangerous when first <= version < end, compared with parse_version.
+    """
     return {
         'openssl': {
-            'dangerous_versions': ['0.9.', '1.0.0', '1.0.1', '1.0.2'],
+            'affected_versions': [('0.9', '1.1')],
             'reason': 'Multiple critical vulnerabilities including Heartbleed'
         },
         'busybox': {
-            'dangerous_versions': ['1.1', '1.2', '1.3', '1.4', '1.5', '1.6'],
+            'affected_versions': [('1.1', '1.7')],
             'reason': 'Multiple command injection vulnerabilities'
         },
         'dropbear': {
-            'dangerous_versions': ['0.', '2015', '2016', '2017'],
+            'affected_versions': [('0', '2018')],
             'reason': 'Multiple authentication bypass vulnerabilities'
         },
         'dnsmasq': {
-            'dangerous_versions': ['2.7', '2.6', '2.5'],
+            'affected_versions': [('2.50', '2.80')],
             'reason': 'Multiple RCE vulnerabilities'
         },
         'uClibc': {
-            'dangerous_versions': ['0.9.32', '0.9.33'],
+            'affected_versions': [('0.9.32', '0.9.34')],
             'reason': 'Format string vulnerabilities and buffer overflows'
         },
         'iptables': {
-            'dangerous_versions': ['1.4', '1.3'],
+            'affected_versions': [('1.3', '1.5')],
             'reason': 'Multiple security bypass vulnerabilities'
         },
         'miniupnpd': {
-            'dangerous_versions': ['1.0', '1.1', '1.2', '1.3', '1.4'],
+            'affected_versions': [('1.0', '1.5')],
             'reason': 'Buffer overflow vulnerabilities'
         },
         'thttpd': {
-            'dangerous_versions': ['2.25', '2.24'],
+            'affected_versions': [('2.24', '2.26')],
             'reason': 'Directory traversal vulnerabilities'
         },
         'mt7628': {  # Add router-specific library checks
-            'dangerous_versions': ['4l_v15', '4l_v14'],
+            'affected_versions': [('4l_v14', '4l_v16')],
+            'version_pattern': r'[\w./-]{0,40}?(\d+l_v\d+)',
             'reason': 'Known buffer overflow in Wi-Fi driver'
         }
     }
 
-def scan_file_content(file_path, verbose=False):
+VERSION_PART = re.compile(r'\d+|[a-z]+')
+
+def parse_version(version):
+    """Turn a version string into a comparable tuple.
+
+    Numeric parts compare as numbers and letter parts as text, so 1.10 sorts
+    after 1.9 and OpenSSL's 1.0.2k after 1.0.2.
+    """
+    return tuple((0, int(part)) if part.isdigit() else (1, part)
+                 for part in VERSION_PART.findall(version.lower()))
+
+def is_affected(lib_info, version):
+    """Check whether a detected version falls in one of a library's affected ranges"""
+    parsed = parse_version(version)
+    return any(parse_version(first) <= parsed < parse_version(end)
+               for first, end in lib_info['affected_versions'])
+
+LIBRARY_NAMES = list(get_dangerous_libs())
+# A library name, an optional separator word ("version", "sshd") and a dotted version
+LIBRARY_VERSION_SUFFIX = r'(?:[ _/-]+(?:[a-z]+ +)?)?v?(\d+(?:\.\d+)+[a-z]?)'
+LIBRARY_PATTERNS = ['(?i)' + re.escape(name) + info.get('version_pattern', LIBRARY_VERSION_SUFFIX)
+                    for name, info in get_dangerous_libs().items()]
+
+# Library version checks share the content rules' engine, so one pass (and one
+# lowercased copy of each gate window) covers both
+CONTENT_RULES = dict(CONTENT_PATTERNS, outdated_library=LIBRARY_PATTERNS)
+CONTENT_ENGINE = RuleEngine(CONTENT_RULES)
+
+# Files above this size are read in windows instead of being mapped whole
+STREAM_THRESHOLD = 10_000_000
+STREAM_WINDOW = 4 * 1024 * 1024
+# Windows overlap by the longest match any content or library check can report
+STREAM_OVERLAP = CONTENT_ENGINE.max_width
+
+class LineIndex:
+    """Resolve buffer offsets to 1-based line numbers.
+
+    Line break offsets are collected on the first lookup and then searched with
+    bisect, so a file with no findings never pays for building the index. Like
+    a text-mode read, \r\n, \r and \n all count as one line break.
+    """
+
+    NEWLINE = re.compile(r'\r\n?|\n')
+    NEWLINE_BYTES = re.compile(rb'\r\n?|\n')
+
+    def __init__(self, buffer, first_line=1):
+        self.buffer = buffer
+        self.first_line = first_line
+        self.line_starts = None
+
+    def line_of(self, offset):
+        if self.line_starts is None:
+            newline = self.NEWLINE if isinstance(self.buffer, str) else self.NEWLINE_BYTES
+            self.line_starts = [m.end() for m in newline.finditer(self.buffer)]
+        return bisect.bisect_right(self.line_starts, offset) + self.first_line
+
+@contextmanager
+def map_file(file_path):
+    """Memory-map a file read-only; empty files, which cannot be mapped, yield b''."""
+    with open(file_path, 'rb') as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            yield b''
+            return
+        try:
+            yield mapped
+        finally:
+            mapped.close()
+
+PRINTABLE = re.compile(r'[\x20-\x7e]*')
+PRINTABLE_BYTES = re.compile(rb'[\x20-\x7e]*')
+
+STRING_MIN_LENGTH = 4
+
+@lru_cache(maxsize=None)
+def _string_patterns(min_length):
+    return (re.compile(rb'[\x20-\x7e]{%d,}' % min_length),
+            re.compile(rb'(?:[\x20-\x7e]\x00){%d,}' % min_length))
+
+def find_string_runs(buffer, min_length=STRING_MIN_LENGTH, wide=True):
+    """Return (start, end, step) for every printable run in buffer, by offset.
+
+    step is 1 for ASCII runs and 2 for UTF-16LE runs, whose text is every
+    other byte from start; wide=False looks for ASCII runs only. buffer can
+    be bytes or an mmap.
+    """
+    ascii_run, utf16_run = _string_patterns(min_length)
+    runs = [(m.start(), m.end(), 1) for m in ascii_run.finditer(buffer)]
+    if wide:
+        runs.extend((m.start(), m.end(), 2) for m in utf16_run.finditer(buffer))
+        runs.sort()
+    return runs
+
+def iter_windows(f, window_size=STREAM_WINDOW, overlap=STREAM_OVERLAP):
+    """Yield (offset, window, limit) tuples covering a binary file.
+
+    Each window holds overlap bytes past limit so any match starting before
+    limit is seen whole; the next window starts at offset + limit. Memory stays
+    at one window no matter how large the file is.
+    """
+    offset = 0
+    window = f.read(window_size + overlap)
+    while len(window) == window_size + overlap:
+        yield offset, window, window_size
+        offset += window_size
+        window = window[window_size:] + f.read(window_size)
+    yield offset, window, len(window)
+
+def scan_windows(windows, file_name, is_text, skip_categories=(), line_of=None):
+    """Run the content rules and library checks over consecutive buffer windows.
+
+    Only matches starting before a window's limit belong to it. Rule positions
+    and line numbers carry over from one window to the next, so the findings
+    are the same as scanning the whole buffer at once. Rules in skip_categories
+    are not reported. line_of, if given, maps an offset in a (single) window to
+    its line number instead.
+    """
+    findings = {}        # rule id -> findings, reported in rule table order
+    resume = {}          # rule id -> absolute offset its next match may start at
+    dangerous_libs = get_dangerous_libs()
+    library_lines = {}   # (library index, version) -> line of its first occurrence
+    previous = None
+
+    for offset, window, limit in windows:
+        binary = not isinstance(window, str)
+        printable = PRINTABLE_BYTES if binary else PRINTABLE
+        if line_of is None:
+            # The previous window's index is only built when there is a next window
+            first_line = previous[0].line_of(previous[1]) if previous else 1
+            lines = LineIndex(window, first_line)
+            previous = (lines, limit)
+            locate = lines.line_of
+        else:
+            locate = line_of
+
+        local_resume = {rule_id: end - offset for rule_id, end in resume.items() if end > offset}
+        for rule_id, start, end in CONTENT_ENGINE.scan(window, local_resume):
+            if start >= limit:
+                continue
+            resume[rule_id] = offset + end
+            category, index = rule_id
+            if category in skip_categories:
+                continue
+            if category == 'outdated_library':
+                version = CONTENT_ENGINE.match(rule_id, window, start).group(1)
+                if binary:
+                    version = bytes(version).decode('latin-1')
+                if (index, version) not in library_lines and is_affected(dangerous_libs[LIBRARY_NAMES[index]], version):
+                    library_lines[(index, version)] = locate(start)
+                continue
+
+            # Filter out binary garbage matches
+            if end - start > MAX_MATCH_LENGTH or (not is_text and not printable.fullmatch(window, start, end)):
+                continue
+
+            matched_text = window[start:end]
+            if binary:
+                matched_text = bytes(matched_text).decode('utf-8' if is_text else 'latin-1', errors='ignore')
+            findings.setdefault(rule_id, []).append({
+                "type": rule_id[0].replace('_', ' ').title(),
+                "file": file_name,
+                "line": locate(start),
+                "match": matched_text.strip()[:60],
+            })
+
+
+    vulnerabilities = [finding for rule_id in sorted(findings, key=CONTENT_ENGINE.order.get)
+                       for finding in findings[rule_id]]
+
+    # Check for library versions, by library and then in order of appearance
+    for (index, version), line in sorted(library_lines.items(), key=lambda item: item[0][0]):
+        lib_name = LIBRARY_NAMES[index]
+        vulnerabilities.append({
+            "type": "Outdated Library",
+            "file": file_name,
+            "line": line,
+            "match": f"{lib_name} version {version} - {dangerous_libs[lib_name]['reason']}"
+        })
+    return vulnerabilities
+
+def scan_buffer(content, file_name, is_text, skip_categories=()):
+    """Run the content rules and library checks over a str or bytes-like buffer"""
+    return scan_windows([(0, content, len(content))], file_name, is_text, skip_categories)
+
+def scan_strings(content, file_name, skip_categories=(), skipped=(), runs=None):
+    """Run the content rules and library checks over a binary buffer's strings only.
+
+    Findings in binaries must be printable anyway, so the rules see just the
+    printable ASCII and UTF-16LE runs (find_string_runs, unless the caller
+    already has them), joined with NUL separators. Offsets are mapped back
+    into content so line numbers match a whole-buffer scan. Runs lying wholly
+    inside one of the sorted (start, end) ranges in skipped are left out.
+    """
+    if runs is None:
+        runs = find_string_runs(content, CONTENT_ENGINE.min_width)
+    if skipped:
+        skipped_starts = [start for start, _ in skipped]
+        def outside(run):
+            i = bisect.bisect_right(skipped_starts, run[0]) - 1
+            return i < 0 or run[1] > skipped[i][1]
+        runs = [run for run in runs if outside(run)]
+    joined_starts = []
+    position = 0
+    for start, end, step in runs:
+        joined_starts.append(position)
+        position += (end - start) // step + 1
+    joined = b'\0'.join(bytes(content[start:end:step]) for start, end, step in runs)
+    lines = LineIndex(content)
+
+    def line_of(offset):
+        run = bisect.bisect_right(joined_starts, offset) - 1
+        start, _, step = runs[run]
+        return lines.line_of(start + (offset - joined_starts[run]) * step)
+
+    return scan_windows([(0, joined, len(joined))], file_name, False, skip_categories, line_of)
+
+# Blocks whose entropy (bits per byte) is above the threshold are treated as
+# compressed or encrypted and skipped by the content rules
+ENTROPY_SKIP_THRESHOLD = 7.5
+ENTROPY_SKIP_BLOCK_SIZE = 4096
+
+def high_entropy_ranges(buffer, threshold=ENTROPY_SKIP_THRESHOLD, block_size=ENTROPY_SKIP_BLOCK_SIZE):
+    """Return the sorted, merged (start, end) byte ranges of buffer's high-entropy blocks.
+
+    A block only counts when both its neighbours are high too, so text at the
+    edge of a compressed payload (sharing a block with it) is still scanned.
+    """
+    high = np.concatenate(([False], entropy_map(buffer, block_size) > threshold, [False]))
+    high = high[1:-1] & high[:-2] & high[2:]
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], high.astype(np.int8), [0]))))
+    return [(int(start) * block_size, min(int(end) * block_size, len(buffer)))
+            for start, end in zip(edges[::2], edges[1::2])]
+
+# Keeps line breaks so line numbers after a masked range don't move
+_MASK_TABLE = bytes(byte if byte in b'\r\n' else 0 for byte in range(256))
+
+def mask_ranges(buffer, ranges, offset=0):
+    """Return a copy of buffer with the bytes in ranges (file offsets) blanked to NUL.
+
+    offset is where buffer starts in the file. Line breaks are kept.
+    """
+    masked = bytearray(buffer)
+    for start, end in ranges:
+        start, end = max(start - offset, 0), min(end - offset, len(masked))
+        if start < end:
+            masked[start:end] = masked[start:end].translate(_MASK_TABLE)
+    return masked
+
+def skipped_region_findings(file_name, ranges):
+    """Record skipped ranges as findings so the report shows what was not scanned"""
+    return [{
+        "type": "Skipped Region",
+        "file": file_name,
+        "line": 0,
+        "match": f"bytes {start:#x}-{end:#x} above {ENTROPY_SKIP_THRESHOLD} bits/byte",
+        "start": start,
+        "end": end
+    } for start, end in ranges]
+
+# Header signatures, checked in order; files matching none are 'text' or
+# 'binary' depending on whether their first block holds a NUL byte
+def _sfnt_header(head):
+    """True if head starts with a TrueType/OpenType table directory.
+
+    Besides the version tag, the directory's binary search fields must agree
+    with its table count, which plain binaries starting 00 01 00 00 rarely do.
+    """
+    if len(head) < 12 or head[:4] not in (b'\x00\x01\x00\x00', b'OTTO', b'true', b'typ1'):
+        return False
+    num_tables, search_range, entry_selector, range_shift = struct.unpack('>4H', head[4:12])
+    if not num_tables:
+        return False
+    selector = num_tables.bit_length() - 1
+    return (entry_selector == selector and search_range == 16 << selector
+            and range_shift == num_tables * 16 - search_range)
+
+FILE_SIGNATURES = [
+    ('elf', ELF_MAGIC),
+    ('script', b'#!'),
+    ('gzip', b'\x1f\x8b'),
+    ('xz', b'\xfd7zXZ\x00'),
+    # props 0x5d and a power-of-two dictionary size, as LZMA-alone writes them
+    ('lzma', re.compile(rb'\x5d\x00\x00(?:[\x01\x02\x04\x08\x10\x20\x40\x80]\x00|\x00[\x01\x02\x04\x08\x10\x20\x40])')),
+    ('squashfs', re.compile(rb'hsqs|sqsh')),
+    # magic then a node type (dirent, inode, cleanmarker, padding, summary)
+    ('jffs2', re.compile(rb'\x85\x19(?:[\x01\x02]\xe0|[\x03\x04\x06]\x20)|\x19\x85(?:\xe0[\x01\x02]|\x20[\x03\x04\x06])')),
+    # newc archives, which the carver unpacks
+    ('cpio', re.compile(rb'07070[12]')),
+    # odc and old binary archives, which it can't
+    ('cpio_legacy', re.compile(rb'070707|\xc7\x71|\x71\xc7')),
+    ('image', re.compile(rb'\x89PNG\r\n\x1a\n|\xff\xd8\xff|GIF8[79]a|RIFF....WEBP', re.DOTALL)),
+    ('font', re.compile(rb'wOF[F2]')),
+    ('font', _sfnt_header),
+    # X.509 certificates and PKCS#12 stores: a long-form SEQUENCE holding another
+    ('der', re.compile(rb'\x30\x82..\x30\x82', re.DOTALL)),
+]
+
+# Detectors each file class is routed to. Compressed and image-like classes
+# only yield noise from the content rules; their contents get scanned once
+# extracted.
+FILE_CLASS_DETECTORS = {
+    'elf': {'password', 'strings', 'elf_metadata'},
+    'script': {'password', 'content'},
+    'text': {'password', 'content'},
+    'binary': {'password', 'strings'},
+    # The unpacked files are scanned, scanning the archive as well only duplicates them
+    'cpio': set(),
+    'cpio_legacy': {'strings'},
+    'gzip': set(),
+    'xz': set(),
+    'lzma': set(),
+    'squashfs': set(),
+    'jffs2': set(),
+    'image': set(),
+    'font': set(),
+    'der': set(),
+}
+
+def classify_buffer(head):
+    """Classify a file from its first bytes into one of FILE_CLASS_DETECTORS' classes"""
+    head = bytes(head[:8192])
+    for file_class, signature in FILE_SIGNATURES:
+        if isinstance(signature, bytes):
+            matched = head.startswith(signature)
+        elif callable(signature):
+            matched = signature(head)
+        else:
+            matched = signature.match(head)
+        if matched:
+            return file_class
+    return 'binary' if b'\x00' in head else 'text'
+
+def classify_file(file_path):
+    """classify_buffer for a file on disk, reading only its first block"""
+    with open(file_path, 'rb') as f:
+        return classify_buffer(f.read(8192))
+
+def run_file_detectors(file_path, content, file_class=None, metadata=None):
+    """Run every detector routed to a file's class over one view of its bytes.
+
+    content is the whole file as bytes or an mmap. It is classified once
+    (unless file_class is given) and handed to the password check, the
+    content rules (strings only, for binaries) and, for ELF files, the
+    linked-library check, so the file is never opened or read again. Pass
+    metadata when the ELF metadata has already been parsed. The content rules
+    skip high-entropy regions, which are listed as Skipped Region findings.
+    """
+    file_name = os.path.basename(file_path)
+    if file_class is None:
+        file_class = classify_buffer(content[:8192])
+    detectors = FILE_CLASS_DETECTORS[file_class]
+    skipped = high_entropy_ranges(content) if detectors & {'content', 'strings'} else []
+    vulnerabilities = []
+    if 'password' in detectors:
+        vulnerabilities.extend(check_password_file(file_path, content))
+    if 'content' in detectors:
+        vulnerabilities.extend(scan_buffer(mask_ranges(content, skipped) if skipped else content, file_name, True))
+    if 'strings' in detectors:
+        # One extraction of the file's strings, shared by the string detectors
+        runs = find_string_runs(content, CONTENT_ENGINE.min_width)
+        vulnerabilities.extend(scan_strings(content, file_name, SYMBOL_RULES if file_class == 'elf' else (),
+                                            skipped, runs))
+    if 'elf_metadata' in detectors:
+        if metadata is None:
+            metadata = parse_elf_metadata(content) or {}
+        vulnerabilities.extend(scan_binary_metadata(file_path, metadata))
+    vulnerabilities.extend(skipped_region_findings(file_name, skipped))
+    return vulnerabilities
+
+def scan_file_content(file_path, verbose=False, use_mmap=True, file_class=None, metadata=None):
+    """Scan a file with the content rules.
+
+    By default the file is memory-mapped once and run_file_detectors matches
+    it as bytes, so workers never hold a decoded copy of it. With
+    use_mmap=False, or when the file cannot be mapped, it is read into a str
+    as before. Files over STREAM_THRESHOLD are read in STREAM_WINDOW windows
+    instead, keeping memory bounded. ELF files skip the SYMBOL_RULES
+    categories, which the symbol index reports instead. Files whose class
+    (see FILE_CLASS_DETECTORS) gets no content rules are not scanned.
+    file_class and metadata are passed on to run_file_detectors when known.
+    """
     vulnerabilities = []
     try:
+        if use_mmap and os.path.getsize(file_path) <= STREAM_THRESHOLD:
+            try:
+                with map_file(file_path) as content:
+                    return run_file_detectors(file_path, content, file_class, metadata)
+            except OSError:
+                pass
+
+        if file_class is None:
+            file_class = classify_file(file_path)
+        detectors = FILE_CLASS_DETECTORS[file_class]
+
         # First check if it's a password file
-        pwd_vulns = check_password_file(file_path)
-        if pwd_vulns:
-            vulnerabilities.extend(pwd_vulns)        # Enhanced patterns for IoT firmware analysis
-        patterns = {
-            'hardcoded_creds': [
-                # More specific password pattern to avoid normal text like "Please enter your password"
-                r'(?i)(?:password|passwd)\s*[=:]\s*[\'"]([^\'"]{3,})[\'""]',
-                r'(?i)(?:username|user|login)\s*[=:]\s*[\'"]([^\'"]{3,})[\'""]',
-                r'(?i)(?:pass|pwd)\s*[=:]\s*[\'"]([^\'"]{3,})[\'""]',
-                r'(?i)admin_pass(?:word)?\s*[=:]\s*[\'"]([^\'"]{3,})[\'""]',
-                r'(?i)api_key\s*[=:]\s*[\'"]([^\'"]{8,})[\'""]',
-                r'(?i)(?:secret|token)\s*[=:]\s*[\'"]([^\'"]{8,})[\'""]',
-                # More specific config-style patterns
-                r'(?i)define\s+[\'"]?(?:PASSWORD|PASS|PWD)[\'"]?\s+[\'"]([^\'"]{3,})[\'"]'
-            ],
-            'command_injection': [
-                r'system\s*\([^)]+\)',
-                r'exec\s*\([^)]+\)',
-                r'popen\s*\([^)]+\)',
-                r'shell_exec\s*\([^)]+\)',
-                r'eval\s*\([^)]+\)'
-            ],
-            'dangerous_functions': [
-                r'strcpy\s*\(',
-                r'strcat\s*\(',
-                r'gets\s*\(',
-                r'scanf\s*\([^)]*%s[^)]*\)',
-                r'printf\s*\([^)]*%n[^)]*\)'
-            ],
-            'dangerous_config': [
-                r'(?i)debug\s*[=:]\s*(true|1|yes)',
-                r'(?i)auth\s*[=:]\s*(false|0|no)',
-                r'(?i)ssl_verify\s*[=:]\s*(false|0|no)',
-                r'(?i)check_cert\s*[=:]\s*(false|0|no)'
-            ],
-            'dangerous_libs': [
-                r'lib([a-z]+)[.-]([0-9.]+)',
-                r'([a-z]+)_version[=: ]+["\']?([0-9.]+)',
-                r'VERSION[=: ]+["\']?([0-9.]+)',
-                r'([a-z-]+) version ([0-9.]+)',
-                r'([a-z-]+)-([0-9.]+)\.so'
-            ],
-            'unsafe_libs': [
-                r'telnetd',
-                r'ftpd',
-                r'/bin/ash',
-                r'/bin/dash',
-                r'libcrypt\.so\.[0-9]',
-                r'libssl\.so\.[0-9]',
-                r'libcrypto\.so\.[0-9]'
-            ],
-            'dangerous_services': [
-                r'telnet\s+stream\s+tcp\s+nowait',
-                r'ftp\s+stream\s+tcp\s+nowait',
-                r'rsh\s+stream\s+tcp\s+nowait',
-                r'/etc/init.d/(telnet|ftp|rsh)',
-                r'inetd\.conf'
-            ],
-            'password_files': [
-                r'/etc/passwd[\w.]*',
-                r'/etc/shadow[\w.]*',
-                r'password[._-]?backup',
-                r'\.htpasswd'
-            ]
-        }
+        if 'password' in detectors:
+            vulnerabilities.extend(check_password_file(file_path))
+        if not detectors & {'content', 'strings'}:
+            return vulnerabilities
+
+        if os.path.getsize(file_path) > STREAM_THRESHOLD:
+            try:
+                with map_file(file_path) as mapped:
+                    skipped = high_entropy_ranges(mapped)
+            except OSError:
+                skipped = []
+            with open(file_path, 'rb') as f:
+                head = f.read(8192)
+                is_text = b'\x00' not in head
+                skip = SYMBOL_RULES if file_class == 'elf' else ()
+                f.seek(0)
+                windows = ((offset, mask_ranges(window, skipped, offset) if skipped else window, limit)
+                           for offset, window, limit in iter_windows(f))
+                vulnerabilities.extend(scan_windows(windows, os.path.basename(file_path), is_text, skip))
+            vulnerabilities.extend(skipped_region_findings(os.path.basename(file_path), skipped))
+            return vulnerabilities
 
         # First try as text file
         try:
@@ -492,83 +2216,56 @@ def scan_file_content(file_path, verbose=False):
             with open(file_path, 'rb') as f:
                 content = f.read().decode('latin-1')
                 is_text = False
-
-        for vuln_type, patterns_list in patterns.items():
-            for pattern in patterns_list:
-                matches = re.finditer(pattern, content)
-                for match in matches:
-                    # Filter out binary garbage matches
-                    matched_text = match.group(0)
-                    if len(matched_text) > 200 or (not is_text and not all(32 <= ord(c) <= 126 for c in matched_text if isinstance(c, str))):
-                        continue
-                        
-                    line_num = content[:match.start()].count('\n') + 1
-                    vulnerabilities.append({
-                        "type": vuln_type.replace('_', ' ').title(),
-                        "file": os.path.basename(file_path),
-                        "line": line_num,
-                        "match": matched_text.strip()[:60],
-                    })
-
-        # Check for library versions
-        dangerous_libs = get_dangerous_libs()
-        for lib_name, lib_info in dangerous_libs.items():
-            if lib_name in content.lower():
-                for version in lib_info.get('dangerous_versions', []):
-                    if version in content:
-                        vulnerabilities.append({
-                            "type": "Outdated Library",
-                            "file": os.path.basename(file_path),
-                            "line": content[:content.find(version)].count('\n') + 1,
-                            "match": f"{lib_name} version {version} - {lib_info['reason']}"
-                        })
+        skip = SYMBOL_RULES if file_class == 'elf' else ()
+        vulnerabilities.extend(scan_buffer(content, os.path.basename(file_path), is_text, skip))
     except Exception as e:
         if verbose:
             print(f"Error scanning {file_path}: {str(e)}")
     return vulnerabilities
 
 def scan_for_vulnerabilities(disassembled_code):
+    """Report every disassembly line containing a keyword, once per keyword.
+
+    The lines are joined and run through the keyword automaton in a single
+    pass; hits are mapped back to their line by offset.
+    """
     vulnerabilities = []
-    patterns = {
-        'unsafe_funcs': [
-            'strcpy', 'strcat', 'gets', 'sprintf', 'scanf',
-            'system', 'exec', 'popen', 'shell_exec'
-        ],
-        'dangerous_ops': [
-            'password', 'admin', 'root', 'shell', 'auth',
-            'key', 'cred', 'secret'
-        ]
-    }
+    lines = list(disassembled_code)
+    text = '\n'.join(lines)
+    line_index = LineIndex(text, first_line=0)
+    hits = {}  # line number -> keyword numbers found on it
+    for number, end in DISASSEMBLY_AUTOMATON.scan(text):
+        hits.setdefault(line_index.line_of(end - 1), set()).add(number)
 
-    for line in disassembled_code:
-        for pattern_type, pattern_list in patterns.items():
-            for pattern in pattern_list:
-                if pattern.lower() in line.lower():
-                    vulnerabilities.append({
-                        "type": pattern_type.replace('_', ' ').title(),
-                        "file": "binary",
-                        "line": line.split(':')[0],
-                        "match": line.strip()
-                    })
+    for line_number in sorted(hits):
+        line = lines[line_number]
+        for number in sorted(hits[line_number]):
+            pattern_type, _ = DISASSEMBLY_AUTOMATON.keywords[number]
+            vulnerabilities.append({
+                "type": pattern_type.replace('_', ' ').title(),
+                "file": "binary",
+                "line": line.split(':')[0],
+                "match": line.strip()
+            })
     return vulnerabilities
 
-def scan_binary_metadata(file_path):
-    """Scan binary files for linked libraries and version information"""
+def scan_binary_metadata(file_path, metadata=None):
+    """Scan binary files for linked libraries and version information
+
+    Pass metadata from parse_elf_metadata when the caller already has it.
+    """
     vulnerabilities = []
     try:
-        # Use readelf to check linked libraries
-        result = subprocess.run(['readelf', '-d', file_path], capture_output=True, text=True)
-        if result.returncode == 0:
-            for line in result.stdout.splitlines():
-                if 'NEEDED' in line:
-                    lib = line.split('[')[-1].split(']')[0]
-                    if any(x in lib.lower() for x in ['libssl', 'libcrypto', 'libcrypt']):
-                        vulnerabilities.append({
-                            "type": "Potentially Unsafe Library",
-                            "file": os.path.basename(file_path),
-                            "line": 0,
-                            "match": f"Links against {lib}"
-                        })
+        if metadata is None:
+            metadata = read_elf_metadata(file_path)
+        for lib in (metadata or {}).get('needed', []):
+            if any(x in lib.lower() for x in ['libssl', 'libcrypto', 'libcrypt']):
+                vulnerabilities.append({
+                    "type": "Potentially Unsafe Library",
+                    "file": os.path.basename(file_path),
+                    "line": 0,
+                    "match": f"Links against {lib}"
+                })
     except:
         pass
     return vulnerabilities
@@ -792,9 +2489,14 @@ class DynamicAnalyzer:
             pass
         return findings
 
-def generate_report(vulnerabilities, output_json=False):
-    """Generate vulnerability report with optional JSON export"""
-    if not vulnerabilities:
+def generate_report(vulnerabilities, output_json=False, delta=None, file_classes=None):
+    """Generate vulnerability report with optional JSON export.
+
+    delta is an incremental summary from compare_manifests, reported alongside
+    the findings when analysing against a baseline. file_classes maps each
+    file class to how many files of it were collected.
+    """
+    if not vulnerabilities and not delta:
         return "No significant vulnerabilities found."
 
     # Deduplicate and normalize findings
@@ -807,12 +2509,17 @@ def generate_report(vulnerabilities, output_json=False):
             'default_weak_credentials': [],
             'dangerous_config': [],
             'hardcoded_creds': [],
-            'command_injection': []
+            'command_injection': [],
+            'dangerous_functions': [],
+            'potentially_unsafe_library': []
         },
         'dynamic': {
             'open_ports': [],
             'fuzzing_results': [],
             'timeline': []
+        },
+        'coverage': {
+            'skipped_regions': []
         }
     }
 
@@ -831,6 +2538,12 @@ def generate_report(vulnerabilities, output_json=False):
                     findings['dynamic']['fuzzing_results'].append(vuln['match'])
                 else:
                     findings['dynamic']['timeline'].append(vuln['match'])
+            elif vuln['type'] == "Skipped Region":
+                findings['coverage']['skipped_regions'].append({
+                    'file': vuln.get('file', ''),
+                    'start': vuln['start'],
+                    'end': vuln['end']
+                })
             else:
                 # Map vulnerability types to categories
                 category_map = {
@@ -841,7 +2554,9 @@ def generate_report(vulnerabilities, output_json=False):
                     'Default/Weak Credentials': 'default_weak_credentials',
                     'Dangerous Config': 'dangerous_config',
                     'Hardcoded Creds': 'hardcoded_creds',
-                    'Command Injection': 'command_injection'
+                    'Command Injection': 'command_injection',
+                    'Dangerous Functions': 'dangerous_functions',
+                    'Potentially Unsafe Library': 'potentially_unsafe_library'
                 }
                 
                 category = category_map.get(vuln['type'])
@@ -853,6 +2568,11 @@ def generate_report(vulnerabilities, output_json=False):
                         'severity': vuln.get('severity', 'MEDIUM')
                     })
 
+    if delta:
+        findings['incremental'] = delta
+    if file_classes:
+        findings['file_classes'] = file_classes
+
     if output_json:
         return json.dumps(findings, indent=2)
 
@@ -877,7 +2597,9 @@ def generate_report(vulnerabilities, output_json=False):
         ('default_weak_credentials', 'Default/Weak Credentials', 'HIGH'),
         ('dangerous_config', 'Dangerous Config', 'MEDIUM'),
         ('hardcoded_creds', 'Hardcoded Creds', 'MEDIUM'),
-        ('command_injection', 'Command Injection', 'HIGH')
+        ('command_injection', 'Command Injection', 'HIGH'),
+        ('dangerous_functions', 'Dangerous Functions', 'MEDIUM'),
+        ('potentially_unsafe_library', 'Potentially Unsafe Library', 'MEDIUM')
     ]
 
     for cat_key, display_name, severity in categories:
@@ -902,24 +2624,1113 @@ def generate_report(vulnerabilities, output_json=False):
             report += "\nDynamic Analysis Summary:\n" + "-" * 40 + "\n"
             report += "\n".join(findings['dynamic']['timeline'])
 
+    skipped = findings['coverage']['skipped_regions']
+    if skipped:
+        report += f"\n🙈 Skipped high-entropy regions ({len(skipped)}):\n"
+        for region in skipped:
+            report += f"  • {region['file']}: bytes {region['start']:#x}-{region['end']:#x}\n"
+
+    if file_classes:
+        report += "\n📁 Files by type:\n"
+        report += "".join(f"  • {file_class}: {count}\n" for file_class, count in file_classes.items())
+
+    # Incremental Analysis Results
+    if delta:
+        files = delta['files']
+        report += f"\n📊 Changes since {delta['baseline']}:\n"
+        report += (f"  • Files: {files['added']} added, {files['changed']} changed, "
+                   f"{files['removed']} removed, {files['unchanged']} unchanged\n")
+        report += f"  • {delta['carried_over']} findings carried over from unchanged files\n"
+        if delta['ruleset_changed']:
+            report += "  • Rules changed since the baseline; every file was rescanned\n"
+        for label, key in (("New", 'new'), ("Fixed", 'fixed')):
+            if delta[key]:
+                report += f"\n{label} ({len(delta[key])}):\n"
+                for v in delta[key]:
+                    report += f"  • {v['path']}:{v['line']} - {v['type']}: {v['match']}\n"
+
     return report
 
+MEDIA_EXTENSIONS = {'.jpg', '.png', '.gif', '.mp3', '.mp4'}
+MAX_TOTAL_SIZE = 500 * 1024 * 1024  # 500MB limit
+
+def collect_files(extracted_dir):
+    """Walk an extracted tree and return {path: size} for the files worth scanning"""
+    file_sizes = {}
+    total_size = 0
+    for root, _, files in os.walk(extracted_dir):
+        for file in files:
+            full_path = os.path.join(root, file)
+            try:
+                # Quick file filtering
+                if os.path.splitext(file)[1].lower() in MEDIA_EXTENSIONS:
+                    continue
+                
+                size = os.path.getsize(full_path)
+                if size < 64:  # Skip tiny files; large ones are streamed
+                    continue
+                
+                total_size += size
+                if total_size > MAX_TOTAL_SIZE:
+                    print("Warning: Total file size exceeds limit, some files will be skipped")
+                    return file_sizes
+                
+                file_sizes[full_path] = size
+            except:
+                continue
+    return file_sizes
+
+SCAN_CACHE_FILE = os.path.join(CACHE_DIR, 'scan_cache.sqlite')
+# Bump when scanning logic changes in a way the rule tables don't capture
+SCANNER_VERSION = 11
+
+def compute_ruleset_version():
+    """Hash the rule tables and scanner settings that decide what a file scan reports"""
+    ruleset = {
+        'scanner': SCANNER_VERSION,
+        # The full table CONTENT_ENGINE runs, library version regexes included
+        'content_rules': CONTENT_RULES,
+        'symbol_rules': SYMBOL_RULES,
+        'dangerous_libs': get_dangerous_libs(),
+        'password_files': PASSWORD_FILES,
+        'file_class_detectors': {name: sorted(detectors) for name, detectors in FILE_CLASS_DETECTORS.items()},
+        'max_match_length': MAX_MATCH_LENGTH,
+        'entropy_skip': [ENTROPY_SKIP_THRESHOLD, ENTROPY_SKIP_BLOCK_SIZE]
+    }
+    return hashlib.sha256(json.dumps(ruleset, sort_keys=True).encode()).hexdigest()
+
+RULESET_VERSION = compute_ruleset_version()
+
+def hash_file(file_path):
+    """Return the SHA-256 hex digest of a file, read in STREAM_WINDOW blocks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(STREAM_WINDOW), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+_scan_cache = threading.local()  # .pid and .conn; a forked worker opens its own
+
+def get_scan_cache():
+    """Return this thread's connection to the on-disk scan result cache.
+
+    Rows written under any other ruleset version are dropped when the
+    connection is opened, so editing the rules invalidates the cache.
+    """
+    if getattr(_scan_cache, 'pid', None) != os.getpid():
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        conn = sqlite3.connect(SCAN_CACHE_FILE, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('''CREATE TABLE IF NOT EXISTS scan_results (
+                            sha256 TEXT NOT NULL,
+                            ruleset TEXT NOT NULL,
+                            password_path INTEGER NOT NULL,
+                            findings TEXT NOT NULL,
+                            PRIMARY KEY (sha256, ruleset, password_path))''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS reports (
+                            sha256 TEXT NOT NULL,
+                            ruleset TEXT NOT NULL,
+                            options TEXT NOT NULL,
+                            analysis_id TEXT NOT NULL,
+                            result_path TEXT NOT NULL,
+                            PRIMARY KEY (sha256, ruleset, options))''')
+        with conn:
+            conn.execute('DELETE FROM scan_results WHERE ruleset != ?', (RULESET_VERSION,))
+            conn.execute('DELETE FROM reports WHERE ruleset != ?', (RULESET_VERSION,))
+        _scan_cache.pid, _scan_cache.conn = os.getpid(), conn
+    return _scan_cache.conn
+
+def load_cached_scan(file_hash, password_path):
+    """Return cached findings for a file hash, or None on a miss"""
+    try:
+        row = get_scan_cache().execute(
+            'SELECT findings FROM scan_results WHERE sha256 = ? AND ruleset = ? AND password_path = ?',
+            (file_hash, RULESET_VERSION, int(password_path))
+        ).fetchone()
+    except sqlite3.Error:
+        return None
+    return json.loads(row[0]) if row else None
+
+def store_cached_scan(file_hash, password_path, findings):
+    """Record the findings for a file hash; a failed write only costs a later rescan"""
+    try:
+        conn = get_scan_cache()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO scan_results VALUES (?, ?, ?, ?)',
+                         (file_hash, RULESET_VERSION, int(password_path), json.dumps(findings)))
+    except sqlite3.Error:
+        pass
+
+# Job workspaces go on tmpfs when one is available and the job is small enough
+WORKSPACE_TMPFS = os.path.join('/dev/shm', 'firmware_analyzer') if os.path.isdir('/dev/shm') else None
+WORKSPACE_TMPFS_LIMIT = 256 * 1024 * 1024
+# Workspace names start with this server's instance; it holds <instance>.lock
+# in UPLOAD_DIR for as long as it runs
+SERVER_INSTANCE = f"{os.getpid()}.{os.urandom(4).hex()}"
+_instance_lock = None
+
+def _lock_file(f):
+    """Take an exclusive lock on an open file without blocking; False if another process holds it"""
+    try:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+def hold_instance_lock():
+    """Lock this server's instance lock file, once, for the life of the process"""
+    global _instance_lock
+    if _instance_lock is None:
+        _instance_lock = open(os.path.join(UPLOAD_DIR, f"{SERVER_INSTANCE}.lock"), 'a+')
+        _lock_file(_instance_lock)
+
+class Workspace:
+    """A private directory for one analysis job, removed by cleanup().
+
+    Jobs expected to stay under WORKSPACE_TMPFS_LIMIT start on tmpfs and
+    spill() to UPLOAD_DIR if they outgrow it. Directory names start with
+    SERVER_INSTANCE, so a restarted server can remove what a dead one left.
+    """
+
+    def __init__(self, expected_size=0):
+        hold_instance_lock()
+        self.on_tmpfs = bool(WORKSPACE_TMPFS) and expected_size <= WORKSPACE_TMPFS_LIMIT
+        if self.on_tmpfs:
+            try:
+                os.makedirs(WORKSPACE_TMPFS, exist_ok=True)
+                self.on_tmpfs = shutil.disk_usage(WORKSPACE_TMPFS).free > 2 * WORKSPACE_TMPFS_LIMIT
+            except OSError:
+                self.on_tmpfs = False
+        root = WORKSPACE_TMPFS if self.on_tmpfs else UPLOAD_DIR
+        self.path = tempfile.mkdtemp(prefix=f"{SERVER_INSTANCE}-", dir=root)
+
+    def file(self, name):
+        """Path of a file in the workspace, named after an untrusted name"""
+        return os.path.join(self.path, werkzeug.utils.secure_filename(name) or 'firmware.bin')
+
+    def spill(self):
+        """Move the workspace from tmpfs to disk"""
+        if not self.on_tmpfs:
+            return
+        target = tempfile.mkdtemp(prefix=f"{SERVER_INSTANCE}-", dir=UPLOAD_DIR)
+        for name in os.listdir(self.path):
+            shutil.move(os.path.join(self.path, name), target)
+        os.rmdir(self.path)
+        self.path = target
+        self.on_tmpfs = False
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cleanup()
+
+def remove_stale_workspaces():
+    """Remove the workspaces of server instances that no longer hold their lock file"""
+    hold_instance_lock()
+    stale = set()
+    for name in os.listdir(UPLOAD_DIR):
+        instance, extension = os.path.splitext(name)
+        if extension != '.lock' or instance == SERVER_INSTANCE:
+            continue
+        lock_path = os.path.join(UPLOAD_DIR, name)
+        try:
+            with open(lock_path, 'a+') as f:
+                if not _lock_file(f):
+                    continue
+            os.remove(lock_path)
+        except OSError:
+            continue
+        stale.add(instance)
+    for root in (WORKSPACE_TMPFS, UPLOAD_DIR):
+        if not root or not os.path.isdir(root):
+            continue
+        for name in os.listdir(root):
+            if name.split('-', 1)[0] in stale:
+                shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+MAX_UPLOAD_SIZE = 2 * 1024 * 1024 * 1024
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_SIZE  # Werkzeug refuses larger requests up front
+UPLOAD_SESSION_TIMEOUT = 24 * 3600  # seconds an idle resumable upload is kept
+CARVE_SIGNATURE_WIDTH = 6  # longest CARVE_SIGNATURES match
+
+class SignatureScanner:
+    """find_signatures over a file that arrives block by block.
+
+    Each block is scanned with the last few bytes of the one before, so
+    headers split between blocks are found too.
+    """
+
+    def __init__(self):
+        self.hits = []
+        self.tail = b''
+        self.end = 0
+        self.recent = set()  # hits starting in the tail, found again next time
+
+    def feed(self, block):
+        buffer = self.tail + bytes(block)
+        start = self.end - len(self.tail)
+        self.end += len(block)
+        self.tail = buffer[-(CARVE_SIGNATURE_WIDTH - 1):]
+        tail_start = self.end - len(self.tail)
+        found = set()
+        for offset, kind in find_signatures(buffer):
+            hit = (offset + start, kind)
+            if hit not in self.recent:
+                self.hits.append(hit)
+            if hit[0] >= tail_start:
+                found.add(hit)
+        self.recent = found
+
+class UploadSession:
+    """A firmware upload being received into its own workspace.
+
+    Blocks are hashed and signature-scanned as they are written, so the
+    image's SHA-256 and CARVE_SIGNATURES hits are ready the moment the last
+    block lands. Uploads with a declared length can be resumed from offset
+    after a dropped connection.
+    """
+
+    def __init__(self, filename, length=None, baseline=None, expected_size=0):
+        self.upload_id = os.urandom(8).hex()
+        self.filename = filename
+        self.length = length
+        self.baseline = baseline
+        self.workspace = Workspace(length if length is not None else expected_size)
+        self.path = self.workspace.file(filename)
+        open(self.path, 'wb').close()
+        self.offset = 0
+        self.digest = hashlib.sha256()
+        self.signatures = SignatureScanner()
+        self.lock = threading.Lock()
+        self.touched = time.time()
+        self.job = None
+
+    @property
+    def complete(self):
+        return self.length is None or self.offset == self.length
+
+    def append(self, stream, limit=MAX_UPLOAD_SIZE):
+        """Append stream to the upload in STREAM_WINDOW blocks.
+
+        Raises RequestEntityTooLarge as soon as the upload would pass limit or
+        its declared length. If the client drops the connection, every whole
+        block that arrived is kept and offset says where to resume.
+        """
+        if self.length is not None:
+            limit = min(limit, self.length)
+        f = open(self.path, 'ab')
+        try:
+            while True:
+                try:
+                    block = stream.read(STREAM_WINDOW)
+                except werkzeug.exceptions.ClientDisconnected:
+                    break
+                if not block:
+                    break
+                if self.offset + len(block) > limit:
+                    raise werkzeug.exceptions.RequestEntityTooLarge(
+                        f"Upload is larger than {limit} bytes")
+                f.write(block)
+                self.digest.update(block)
+                self.signatures.feed(block)
+                self.offset += len(block)
+                if self.workspace.on_tmpfs and self.offset > WORKSPACE_TMPFS_LIMIT:
+                    f.close()
+                    self.workspace.spill()
+                    self.path = self.workspace.file(self.filename)
+                    f = open(self.path, 'ab')
+        finally:
+            f.close()
+            self.touched = time.time()
+
+    def start_job(self):
+        """Hand the finished upload, and its workspace, to the job scheduler"""
+        self.job = get_job_scheduler().submit(self.filename, self.workspace, self.path,
+                                              self.digest.hexdigest(), self.baseline,
+                                              self.signatures.hits)
+        return self.job
+
+    def status(self):
+        return {
+            'upload_id': self.upload_id,
+            'filename': self.filename,
+            'offset': self.offset,
+            'length': self.length,
+            'job': self.job.status() if self.job else None
+        }
+
+_upload_sessions = {}
+_upload_sessions_lock = threading.Lock()
+
+def open_upload_session(filename, length, baseline):
+    """Start a resumable upload, dropping uploads idle for UPLOAD_SESSION_TIMEOUT"""
+    session = UploadSession(filename, length, baseline)
+    expired = time.time() - UPLOAD_SESSION_TIMEOUT
+    with _upload_sessions_lock:
+        for upload_id, old in list(_upload_sessions.items()):
+            if old.touched < expired and not old.lock.locked():
+                del _upload_sessions[upload_id]
+                # A started job owns the workspace and removes it itself
+                if old.job is None:
+                    old.workspace.cleanup()
+        _upload_sessions[session.upload_id] = session
+    return session
+
+def get_upload_session(upload_id):
+    with _upload_sessions_lock:
+        return _upload_sessions.get(upload_id)
+
+def report_options(baseline):
+    """The request options a /analyze report depends on besides the image and ruleset"""
+    return json.dumps({
+        'baseline': baseline['analysis_id'] if baseline else None,
+        'extractor': EXTRACTOR_VERSION
+    }, sort_keys=True)
+
+def load_cached_report(firmware_hash, options):
+    """Return (analysis ID, result path) of a stored report, or None on a miss"""
+    try:
+        row = get_scan_cache().execute(
+            'SELECT analysis_id, result_path FROM reports WHERE sha256 = ? AND ruleset = ? AND options = ?',
+            (firmware_hash, RULESET_VERSION, options)
+        ).fetchone()
+    except sqlite3.Error:
+        return None
+    # A report deleted from RESULTS_DIR is a miss
+    return row if row and os.path.isfile(row[1]) else None
+
+def store_cached_report(firmware_hash, options, analysis_id, result_path):
+    """Record where the report of an image is stored; a failed write only costs a later rescan"""
+    try:
+        conn = get_scan_cache()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO reports VALUES (?, ?, ?, ?, ?)',
+                         (firmware_hash, RULESET_VERSION, options, analysis_id, result_path))
+    except sqlite3.Error:
+        pass
+
+EXTRACT_CACHE_DIR = os.path.join(CACHE_DIR, 'extracted')
+EXTRACT_CACHE_BUDGET = 4 * 1024 * 1024 * 1024  # bytes of extracted trees kept on disk
+EXTRACTOR_VERSION = 3  # bump when extraction output changes so cached trees are redone
+
+class ExtractionCache:
+    """Extracted firmware trees on disk, keyed by the image's SHA-256.
+
+    A job acquires the tree of an image, which extracts it on a miss, and
+    releases it when done. Jobs on the same image share one tree and one
+    extraction. Trees not in use are evicted least recently used first once
+    the cache is over budget. Sizes and last use times are kept in
+    index.json so the LRU order survives restarts.
+    """
+
+    def __init__(self, root=EXTRACT_CACHE_DIR, budget=EXTRACT_CACHE_BUDGET):
+        self.root = root
+        self.budget = budget
+        self.index_file = os.path.join(root, 'index.json')
+        self.lock = threading.Lock()
+        self.refs = Counter()  # key -> jobs using the tree
+        self.building = {}  # key -> event set when its extraction finishes
+        os.makedirs(root, exist_ok=True)
+        try:
+            with open(self.index_file) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = {}
+        self.entries = {key: entry for key, entry in entries.items() if os.path.isdir(self.path(key))}
+        # Leftovers of extractions or evictions cut short
+        for name in os.listdir(root):
+            if name.endswith('.partial'):
+                shutil.rmtree(self.path(name), ignore_errors=True)
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def _save(self):
+        with open(self.index_file + '.tmp', 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(self.index_file + '.tmp', self.index_file)
+
+    def _evict(self):
+        """Unlist idle trees, oldest first, until within budget; returns their new paths to delete.
+
+        Called with the lock held. Trees are renamed out of the way here and
+        deleted by the caller after releasing it.
+        """
+        total = sum(entry['size'] for entry in self.entries.values())
+        doomed = []
+        for key in sorted(self.entries, key=lambda k: self.entries[k]['last_used']):
+            if total <= self.budget:
+                break
+            if self.refs[key]:
+                continue
+            total -= self.entries.pop(key)['size']
+            trash = self.path(f"{key}.{time.time_ns()}.partial")
+            os.rename(self.path(key), trash)
+            doomed.append(trash)
+        if doomed:
+            self._save()
+        return doomed
+
+    def acquire(self, firmware_path, firmware_hash=None, signatures=None):
+        """Return (key, extracted directory, cache hit) for a firmware image.
+
+        The tree stays in the cache until release(key). If another job is
+        extracting the same image, this waits for it instead of extracting
+        again. signatures are passed on to extract_firmware.
+        """
+        key = f"{firmware_hash or hash_file(firmware_path)}-{EXTRACTOR_VERSION}"
+        while True:
+            with self.lock:
+                if key in self.entries:
+                    self.refs[key] += 1
+                    self.entries[key]['last_used'] = time.time()
+                    self._save()
+                    return key, self.path(key), True
+                building = self.building.get(key)
+                if building is None:
+                    building = self.building[key] = threading.Event()
+                    break
+            building.wait()
+
+        partial = self.path(f"{key}.{threading.get_ident()}.partial")
+        try:
+            extract_firmware(firmware_path, partial, signatures)
+            size = _tree_weight([partial])[0]
+            os.rename(partial, self.path(key))
+            with self.lock:
+                self.entries[key] = {'size': size, 'last_used': time.time()}
+                self.refs[key] += 1
+                self._save()
+                doomed = self._evict()
+        except Exception:
+            shutil.rmtree(partial, ignore_errors=True)
+            raise
+        finally:
+            with self.lock:
+                del self.building[key]
+            building.set()
+        for trash in doomed:
+            shutil.rmtree(trash, ignore_errors=True)
+        return key, self.path(key), False
+
+    def release(self, key):
+        """Drop a job's reference to a tree, evicting if the cache is over budget"""
+        with self.lock:
+            self.refs[key] -= 1
+            if self.refs[key] <= 0:
+                del self.refs[key]
+            if key in self.entries:
+                self.entries[key]['last_used'] = time.time()
+            self._save()
+            doomed = self._evict()
+        for trash in doomed:
+            shutil.rmtree(trash, ignore_errors=True)
+
+_extraction_cache = None
+_extraction_cache_lock = threading.Lock()
+
+def get_extraction_cache():
+    """Return the process-wide extraction cache, opening it on first use"""
+    global _extraction_cache
+    with _extraction_cache_lock:
+        if _extraction_cache is None:
+            _extraction_cache = ExtractionCache()
+        return _extraction_cache
+
 def process_single_file(args):
-    """Process a single file for parallel execution"""
-    file_path, verbose = args
+    """Scan one file, caching its findings by SHA-256 under the current ruleset.
+
+    args is (path, verbose, described), described being the file's
+    describe_file results if known, so it is not hashed or classified again.
+    """
+    file_path, verbose, described = args
     try:
-        return scan_file_content(file_path, verbose)
+        password_path = is_password_path(file_path)
+        if described and described[0]:
+            file_hash, file_class, metadata = described
+            cached = load_cached_scan(file_hash, password_path)
+            if cached is not None:
+                file_name = os.path.basename(file_path)
+                return [dict(finding, file=file_name) for finding in cached]
+            vulnerabilities = scan_file_content(file_path, verbose, file_class=file_class,
+                                                metadata=metadata)
+            store_cached_scan(file_hash, password_path, vulnerabilities)
+            return vulnerabilities
+        with ExitStack() as stack:
+            content = None
+            if os.path.getsize(file_path) <= STREAM_THRESHOLD:
+                try:
+                    content = stack.enter_context(map_file(file_path))
+                except OSError:
+                    pass  # scan_file_content falls back to reading it
+            file_hash = hash_file(file_path) if content is None else hashlib.sha256(content).hexdigest()
+            cached = load_cached_scan(file_hash, password_path)
+            if cached is not None:
+                file_name = os.path.basename(file_path)
+                return [dict(finding, file=file_name) for finding in cached]
+            if content is None:
+                vulnerabilities = scan_file_content(file_path, verbose)
+            else:
+                vulnerabilities = run_file_detectors(file_path, content)
+        store_cached_scan(file_hash, password_path, vulnerabilities)
+        return vulnerabilities
     except Exception as e:
         if verbose:
             print(f"Error processing {file_path}: {e}")
         return []
 
-def parallel_file_scan(file_paths, verbose=False):
-    """Process files in parallel using process pool"""
-    tasks = [(f, verbose) for f in file_paths]
-    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
-        results = list(executor.map(process_single_file, tasks))
-    return [item for sublist in results if sublist for item in sublist]
+_scan_pool = None
+_scan_pool_lock = threading.Lock()
+
+def _warm_worker(_):
+    """No-op task used to start pool workers ahead of the first scan"""
+    return os.getpid()
+
+def get_scan_pool():
+    """Return the process-wide scan pool, starting and warming it on first use.
+
+    The pool lives for the whole process and is shared by CLI runs and every
+    /analyze request. A pool broken by a crashed worker is replaced.
+    """
+    global _scan_pool
+    with _scan_pool_lock:
+        if _scan_pool is None or getattr(_scan_pool, '_broken', False):
+            workers = os.cpu_count() or 1
+            _scan_pool = ProcessPoolExecutor(max_workers=workers)
+            list(_scan_pool.map(_warm_worker, range(workers)))
+        return _scan_pool
+
+def _map_chunk(fn, items):
+    return [fn(item) for item in items]
+
+class FairShare:
+    """Shares the scan pool's workers fairly between running jobs.
+
+    Each job's tasks wait in a queue of their own and only capacity tasks
+    are on the pool at a time. Whenever one finishes, the next comes from the
+    job with the fewest tasks running (the one served longest ago on a tie),
+    so every job gets an equal share of the CPUs however many tasks it has
+    queued. Tasks are handed to the pool by a dispatcher thread, never from
+    a pool callback.
+    """
+
+    def __init__(self, capacity=None):
+        self.capacity = capacity or os.cpu_count() or 1
+        self.ready = threading.Condition()
+        self.queues = {}  # job -> deque of (future, fn, args) not yet on the pool
+        self.running = Counter()  # job -> tasks on the pool
+        self.dispatcher = None
+
+    def submit(self, job, fn, *args):
+        future = Future()
+        with self.ready:
+            self.queues.setdefault(job, deque()).append((future, fn, args))
+            if self.dispatcher is None:
+                self.dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+                self.dispatcher.start()
+            self.ready.notify()
+        return future
+
+    def _next_task(self):
+        """Wait for a free worker and a queued task; called with the condition held"""
+        while True:
+            waiting = [job for job, tasks in self.queues.items() if tasks]
+            if waiting and sum(self.running.values()) < self.capacity:
+                job = min(waiting, key=lambda j: self.running[j])
+                # Taking the job's queue to the back breaks ties round-robin
+                tasks = self.queues.pop(job)
+                future, fn, args = tasks.popleft()
+                if tasks:
+                    self.queues[job] = tasks
+                # Tasks cancelled while queued never reach the pool
+                if future.set_running_or_notify_cancel():
+                    self.running[job] += 1
+                    return job, future, fn, args
+                continue
+            self.ready.wait()
+
+    def _dispatch(self):
+        while True:
+            with self.ready:
+                job, future, fn, args = self._next_task()
+            try:
+                task = get_scan_pool().submit(fn, *args)
+            except Exception as e:
+                self._finished(job, future, None, e)
+                continue
+            task.add_done_callback(lambda task, job=job, future=future: self._finished(job, future, task))
+
+    def _finished(self, job, future, task, error=None):
+        with self.ready:
+            self.running[job] -= 1
+            if self.running[job] <= 0:
+                del self.running[job]
+            self.ready.notify()
+        error = error or task.exception()
+        if error:
+            future.set_exception(error)
+        else:
+            future.set_result(task.result())
+
+class JobPool:
+    """The submit and map of the scan pool, for one job's share of it"""
+
+    def __init__(self, job, share):
+        self.job = job
+        self.share = share
+
+    def submit(self, fn, *args):
+        return self.share.submit(self.job, fn, *args)
+
+    def map(self, fn, iterable, chunksize=1):
+        items = list(iterable)
+        futures = [self.submit(_map_chunk, fn, items[i:i + chunksize])
+                   for i in range(0, len(items), chunksize)]
+
+        def results():
+            for future in futures:
+                yield from future.result()
+        return results()
+
+_job_context = threading.local()  # .pool of the job running on this thread
+
+def task_pool():
+    """The pool this thread's tasks should go to: its job's share, or the whole scan pool"""
+    return getattr(_job_context, 'pool', None) or get_scan_pool()
+
+MAX_RUNNING_JOBS = 2
+JOB_RETENTION = 3600  # seconds a finished job stays queryable
+
+class AnalysisJob:
+    """State of one /analyze job, as reported by /jobs/<id>"""
+
+    def __init__(self, job_id, filename):
+        self.job_id = job_id
+        self.filename = filename
+        self.stage = 'queued'
+        self.files_total = 0
+        self.files_done = 0
+        self.queued_at = time.time()
+        self.started_at = self.scan_started_at = self.finished_at = None
+        self.analysis_id = self.result_path = self.error = None
+        self.cache_headers = {}
+        self.future = None
+
+    def start_scan(self, files_total):
+        self.stage = 'scanning'
+        self.files_total = files_total
+        self.scan_started_at = time.time()
+
+    def status(self):
+        """The job's stage, file progress and, while scanning, its ETA"""
+        eta = None
+        if self.stage == 'scanning' and self.files_done:
+            rate = (time.time() - self.scan_started_at) / self.files_done
+            eta = round(rate * (self.files_total - self.files_done), 1)
+
+        def stamp(t):
+            return datetime.fromtimestamp(t).isoformat() if t else None
+        return {
+            'job_id': self.job_id,
+            'filename': self.filename,
+            'status': self.stage,
+            'files': {'done': self.files_done, 'total': self.files_total},
+            'progress': round(self.files_done / self.files_total, 3) if self.files_total else None,
+            'eta_seconds': eta,
+            'queued_at': stamp(self.queued_at),
+            'started_at': stamp(self.started_at),
+            'finished_at': stamp(self.finished_at),
+            'analysis_id': self.analysis_id,
+            'error': self.error,
+            'results': f"/jobs/{self.job_id}/results" if self.stage == 'done' else None
+        }
+
+class JobScheduler:
+    """Runs /analyze jobs, at most max_running at once, on one FairShare of the scan pool"""
+
+    def __init__(self, max_running=MAX_RUNNING_JOBS):
+        self.executor = ThreadPoolExecutor(max_workers=max_running)
+        self.share = FairShare()
+        self.lock = threading.Lock()
+        self.jobs = {}
+
+    def submit(self, filename, workspace, firmware_path, firmware_hash, baseline, signatures=None):
+        """Queue the analysis of a saved upload; the job owns workspace from here on"""
+        job = AnalysisJob(os.urandom(8).hex(), filename)
+        with self.lock:
+            expired = time.time() - JOB_RETENTION
+            self.jobs = {job_id: old for job_id, old in self.jobs.items()
+                         if not old.finished_at or old.finished_at > expired}
+            self.jobs[job.job_id] = job
+        job.future = self.executor.submit(self._run, job, workspace, firmware_path, firmware_hash,
+                                          baseline, signatures)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def _run(self, job, workspace, firmware_path, firmware_hash, baseline, signatures):
+        job.started_at = time.time()
+        job.stage = 'starting'
+        _job_context.pool = JobPool(job.job_id, self.share)
+        try:
+            analyze_upload(firmware_path, firmware_hash, job.filename, baseline, job, signatures)
+            job.stage = 'done'
+        except Exception as e:
+            job.stage = 'failed'
+            job.error = str(e)
+            raise
+        finally:
+            _job_context.pool = None
+            job.finished_at = time.time()
+            workspace.cleanup()
+
+_job_scheduler = None
+_job_scheduler_lock = threading.Lock()
+
+def get_job_scheduler():
+    """Return the process-wide job scheduler, starting it on first use"""
+    global _job_scheduler
+    with _job_scheduler_lock:
+        if _job_scheduler is None:
+            _job_scheduler = JobScheduler()
+        return _job_scheduler
+
+# Byte weight of a scan batch is aimed between these bounds
+MIN_BATCH_BYTES = 1024 * 1024
+MAX_BATCH_BYTES = 8 * 1024 * 1024
+# Cap on files per batch so one batch of tiny files stays a short task
+MAX_BATCH_FILES = 256
+
+def plan_scan_batches(file_paths, sizes, workers):
+    """Group file indices into scan batches, heaviest batch first.
+
+    Files are taken largest first. Any file at or above the target weight is a
+    batch of its own, and the smaller ones are packed into batches of roughly
+    the target weight, so workers get few round trips for tiny files and the
+    big binaries start early instead of straggling at the end.
+    """
+    order = sorted(range(len(file_paths)), key=lambda i: sizes[i], reverse=True)
+    target = min(MAX_BATCH_BYTES, max(MIN_BATCH_BYTES, sum(sizes) // (workers * 8)))
+    batches = []
+    batch, weight = [], 0
+    for i in order:
+        if sizes[i] >= target:
+            batches.append(([i], sizes[i]))
+            continue
+        if batch and (weight + sizes[i] > target or len(batch) >= MAX_BATCH_FILES):
+            batches.append((batch, weight))
+            batch, weight = [], 0
+        batch.append(i)
+        weight += sizes[i]
+    if batch:
+        batches.append((batch, weight))
+    batches.sort(key=lambda b: b[1], reverse=True)
+    return [indices for indices, _ in batches]
+
+def process_file_batch(args):
+    """Process a batch of (index, path, described) tuples, returning (index, vulnerabilities) pairs"""
+    files, verbose = args
+    return [(index, process_single_file((file_path, verbose, described)))
+            for index, file_path, described in files]
+
+def iter_file_scan(file_paths, verbose=False, sizes=None, described=None):
+    """Scan files on the shared pool, yielding (index, vulnerabilities) as each finishes.
+
+    sizes and described (see manifest_described) carry what collect_files and
+    build_manifest already know about each file. Batches from
+    plan_scan_batches are all queued at once; those still queued when the
+    caller stops iterating are cancelled.
+    """
+    sizes = sizes or {}
+    file_sizes = []
+    for file_path in file_paths:
+        size = sizes.get(file_path)
+        if size is None:
+            try:
+                size = os.path.getsize(file_path)
+            except OSError:
+                size = 0
+        file_sizes.append(size)
+
+    pool = task_pool()
+    batches = plan_scan_batches(file_paths, file_sizes, os.cpu_count() or 1)
+    described = described or {}
+    futures = [pool.submit(process_file_batch,
+                           ([(i, file_paths[i], described.get(file_paths[i])) for i in batch], verbose))
+               for batch in batches]
+    try:
+        for future in as_completed(futures):
+            yield from future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+def binwalk_dir_name(firmware_path):
+    """The directory binwalk extracts firmware_path into, named after the file"""
+    return f"_{os.path.basename(firmware_path)}.extracted"
+
+def make_analysis_id(firmware_path):
+    """Name an analysis after its firmware file and start time"""
+    base_name = os.path.splitext(os.path.basename(firmware_path))[0]
+    # The suffix keeps concurrent analyses of same-named uploads apart
+    return f"{base_name}_{time.strftime('%Y%m%d-%H%M%S')}-{os.urandom(3).hex()}"
+
+def manifest_key(extracted_dir, file_path, binwalk_dir=None):
+    """Key a file by its path inside the extracted tree, stable across firmware versions"""
+    parts = os.path.relpath(file_path, extracted_dir).split(os.sep)
+    # Only binwalk's top directory (binwalk_dir) is named after the upload
+    if binwalk_dir and parts[0] == binwalk_dir:
+        parts[0] = '_firmware.extracted'
+    return '/'.join(parts)
+
+def hash_file_or_none(file_path):
+    """hash_file for pool use; unreadable files hash to None and always count as changed"""
+    try:
+        return hash_file(file_path)
+    except OSError:
+        return None
+
+def elf_symbols(metadata):
+    """Split the dynamic symbols in parse_elf_metadata results into imports and exports"""
+    public = [symbol for symbol in metadata['symbols'] if symbol['name'] and symbol['bind'] != 'LOCAL']
+    return {
+        'imports': sorted({symbol['name'] for symbol in public if not symbol['defined']}),
+        'exports': sorted({symbol['name'] for symbol in public if symbol['defined']})
+    }
+
+def describe_file(file_path):
+    """Hash, classify and read the ELF metadata of a file, mapping it once, in a pool task"""
+    with ExitStack() as stack:
+        content = None
+        try:
+            if os.path.getsize(file_path) <= STREAM_THRESHOLD:
+                content = stack.enter_context(map_file(file_path))
+        except OSError:
+            pass
+        if content is None:
+            file_hash = hash_file_or_none(file_path)
+        else:
+            file_hash = hashlib.sha256(content).hexdigest()
+        if not file_hash:
+            return None, None, None, None
+        try:
+            file_class = classify_buffer(content[:8192]) if content is not None else classify_file(file_path)
+            if file_class != 'elf':
+                return file_hash, file_class, None, None
+            metadata = parse_elf_metadata(content) if content is not None else read_elf_metadata(file_path)
+        except Exception:
+            return file_hash, None, None, None
+    if not metadata:
+        return file_hash, file_class, None, None
+    return file_hash, file_class, elf_symbols(metadata), {'needed': metadata['needed']}
+
+class SymbolIndex:
+    """Firmware-wide index of the symbols each ELF binary imports and exports.
+
+    Binaries are keyed by manifest key. Queries are set lookups, so asking
+    which binaries import system and gets costs no file access.
+    """
+
+    def __init__(self):
+        self.imports = {}   # symbol -> keys of binaries importing it
+        self.exports = {}   # symbol -> keys of binaries exporting it
+        self.binaries = {}  # key -> file path
+
+    def add(self, key, file_path, symbols):
+        self.binaries[key] = file_path
+        for name in symbols['imports']:
+            self.imports.setdefault(name, set()).add(key)
+        for name in symbols['exports']:
+            self.exports.setdefault(name, set()).add(key)
+
+    def importers(self, *names):
+        """Return the sorted keys of binaries importing every one of names"""
+        found = [self.imports.get(name, set()) for name in names]
+        return sorted(set.intersection(*found)) if found else []
+
+    def exporters(self, *names):
+        """Return the sorted keys of binaries exporting every one of names"""
+        found = [self.exports.get(name, set()) for name in names]
+        return sorted(set.intersection(*found)) if found else []
+
+def build_symbol_index(manifest):
+    """Index the symbols build_manifest read for every ELF file in the manifest"""
+    index = SymbolIndex()
+    for key, entry in manifest['files'].items():
+        if entry.get('symbols'):
+            index.add(key, entry['path'], entry['symbols'])
+    return index
+
+def apply_symbol_findings(manifest, index):
+    """Store each binary's SYMBOL_RULES findings, answered from the index, in the manifest"""
+    found = {}
+    for category, names in SYMBOL_RULES.items():
+        for name in names:
+            for key in index.importers(name):
+                found.setdefault(key, []).append({
+                    "type": category.replace('_', ' ').title(),
+                    "file": os.path.basename(index.binaries[key]),
+                    "line": 0,
+                    "match": f"Imports {name}"
+                })
+    for key, entry in manifest['files'].items():
+        entry['symbol_findings'] = found.get(key, [])
+
+def build_manifest(analysis_id, firmware_path, extracted_dir, file_sizes):
+    """Hash every collected file into a manifest that later analyses can diff against.
+
+    The same pass reads the imported and exported symbols of ELF files.
+    """
+    paths = list(file_sizes)
+    described = task_pool().map(describe_file, paths, chunksize=64)
+    binwalk_dir = binwalk_dir_name(firmware_path)
+    files = {}
+    for path, (file_hash, file_class, symbols, metadata) in zip(paths, described):
+        key = manifest_key(extracted_dir, path, binwalk_dir)
+        if key in files:
+            # Never let two files share a key; the unrenamed path is unique
+            key = manifest_key(extracted_dir, path)
+        files[key] = {
+            'path': path,
+            'sha256': file_hash,
+            'size': file_sizes[path],
+            'class': file_class,
+            'symbols': symbols,
+            'metadata': metadata,
+            'findings': None
+        }
+    return {
+        'analysis_id': analysis_id,
+        'firmware': os.path.basename(firmware_path),
+        'ruleset': RULESET_VERSION,
+        'files': files
+    }
+
+def manifest_described(manifest):
+    """Map each manifest file's path to its sha256, class and metadata for iter_file_scan"""
+    return {entry['path']: (entry['sha256'], entry['class'], entry['metadata'])
+            for entry in manifest['files'].values()}
+
+def manifest_file(analysis_id):
+    """Return where the manifest of an analysis is stored"""
+    return os.path.join(RESULTS_DIR, f"{werkzeug.utils.secure_filename(analysis_id)}_manifest.json")
+
+def save_manifest(manifest):
+    """Store a manifest under RESULTS_DIR so it can serve as a baseline"""
+    stored = dict(manifest, files={
+        key: {k: v for k, v in entry.items() if k not in ('path', 'symbols', 'metadata')}
+        for key, entry in manifest['files'].items()
+    })
+    with open(manifest_file(manifest['analysis_id']), 'w') as f:
+        json.dump(stored, f)
+
+def validate_manifest(manifest):
+    """Raise ValueError unless manifest has the structure save_manifest writes"""
+    if not isinstance(manifest, dict) or not isinstance(manifest.get('analysis_id'), str):
+        raise ValueError("Baseline is not an analysis manifest")
+    files = manifest.get('files')
+    if not isinstance(files, dict):
+        raise ValueError("Baseline manifest has no file list")
+    for key, entry in files.items():
+        if not isinstance(entry, dict) or 'sha256' not in entry:
+            raise ValueError(f"Baseline manifest entry for {key} is malformed")
+        for field in ('findings', 'symbol_findings'):
+            findings = entry.get(field)
+            if findings is None:
+                continue
+            if not isinstance(findings, list) or not all(
+                    isinstance(finding, dict) and 'type' in finding and 'match' in finding
+                    for finding in findings):
+                raise ValueError(f"Baseline manifest entry for {key} has malformed {field}")
+
+def load_baseline(reference, allow_paths=True):
+    """Load a baseline manifest from an analysis ID or, if allow_paths, a manifest file path"""
+    if allow_paths and os.path.isfile(reference):
+        path = reference
+    else:
+        path = manifest_file(reference)
+    if not os.path.isfile(path):
+        raise ValueError(f"Unknown baseline analysis: {reference}")
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Cannot read baseline {reference}: {e}")
+    validate_manifest(manifest)
+    return manifest
+
+def apply_baseline(manifest, baseline):
+    """Carry findings forward for files unchanged since a same-ruleset baseline; return the paths to scan"""
+    reuse = baseline is not None and baseline.get('ruleset') == RULESET_VERSION
+    pending = []
+    for key, entry in manifest['files'].items():
+        previous = baseline['files'].get(key) if reuse else None
+        if (previous and entry['sha256'] and previous['sha256'] == entry['sha256']
+                and previous.get('findings') is not None):
+            entry['findings'] = previous['findings']
+        else:
+            pending.append(entry['path'])
+    return pending
+
+def manifest_file_classes(manifest):
+    """Count a manifest's files per class, most common first"""
+    return dict(Counter(entry.get('class') or 'unreadable' for entry in manifest['files'].values()).most_common())
+
+# Finding types that record scan coverage rather than a vulnerability
+COVERAGE_TYPES = {'Skipped Region'}
+
+def entry_findings(entry):
+    """A manifest entry's content findings followed by its symbol findings"""
+    return (entry['findings'] or []) + entry.get('symbol_findings', [])
+
+def manifest_findings(manifest):
+    """Flatten a manifest's per-file findings in collection order"""
+    return [finding for entry in manifest['files'].values() for finding in entry_findings(entry)]
+
+def compare_manifests(baseline, manifest):
+    """Summarize files and findings that are new, fixed or carried over since the baseline.
+
+    Findings are matched on file, type and match text, ignoring line numbers,
+    so code that merely moved inside a changed file is not reported as new.
+    """
+    old_files, new_files = baseline['files'], manifest['files']
+    unchanged = [key for key, entry in new_files.items()
+                 if key in old_files and entry['sha256'] and entry['sha256'] == old_files[key]['sha256']]
+
+    def keyed(files):
+        return [((key, f['type'], f['match']), dict(f, path=key))
+                for key, entry in files.items() for f in entry_findings(entry)
+                if f['type'] not in COVERAGE_TYPES]
+
+    before, after = keyed(old_files), keyed(new_files)
+    before_keys = {k for k, _ in before}
+    after_keys = {k for k, _ in after}
+    return {
+        'baseline': baseline['analysis_id'],
+        'ruleset_changed': baseline.get('ruleset') != manifest['ruleset'],
+        'files': {
+            'added': sum(1 for key in new_files if key not in old_files),
+            'changed': len([key for key in new_files if key in old_files]) - len(unchanged),
+            'removed': sum(1 for key in old_files if key not in new_files),
+            'unchanged': len(unchanged)
+        },
+        'new': [f for k, f in after if k not in before_keys],
+        # Files left unscanned by an interrupted run have no findings to compare
+        'fixed': [f for k, f in before
+                  if k not in after_keys and new_files.get(k[0], {}).get('findings', []) is not None],
+        'carried_over': sum(1 for key in unchanged for f in entry_findings(new_files[key])
+                            if f['type'] not in COVERAGE_TYPES)
+    }
 
 def main():
     parser = argparse.ArgumentParser(description="IoT Firmware Vulnerability Analyzer")
@@ -930,11 +3741,20 @@ def main():
     parser.add_argument("-v", "--verbose", action="store_true", help="Enable verbose output")
     parser.add_argument("-d", "--dynamic", action="store_true", help="Perform dynamic analysis")
     parser.add_argument("-j", "--json", action="store_true", help="Export results to JSON")
+    parser.add_argument("-b", "--baseline", help="Analysis ID or manifest of a previous version; only changed files are rescanned")
+    parser.add_argument("--max-jobs", type=int, default=MAX_RUNNING_JOBS, help="Analyses the server runs at once (default: %d)" % MAX_RUNNING_JOBS)
+    parser.add_argument("--extract-cache-mb", type=int, help="Disk budget of the server's extraction cache in MB (default: %d)" % (EXTRACT_CACHE_BUDGET // (1024 * 1024)))
     args = parser.parse_args()
 
     if args.server:
         print(f"Starting server on {args.host}:{args.port}")
         print("Upload endpoint: http://{}:{}/analyze".format(args.host, args.port))
+        get_scan_pool()
+        remove_stale_workspaces()
+        global _job_scheduler
+        _job_scheduler = JobScheduler(max(1, args.max_jobs))
+        if args.extract_cache_mb is not None:
+            get_extraction_cache().budget = args.extract_cache_mb * 1024 * 1024
         app.run(host=args.host, port=args.port)
         return
 
@@ -943,42 +3763,33 @@ def main():
         print("Error: Firmware file required in CLI mode")
         return
 
+    baseline = None
+    if args.baseline:
+        try:
+            baseline = load_baseline(args.baseline)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+
     extracted_dir = extract_firmware(args.firmware)
+    analysis_id = make_analysis_id(args.firmware)
     print("\nStarting deep analysis of extracted contents...")
     
-    all_files = []
-    total_size = 0
-    MAX_TOTAL_SIZE = 500 * 1024 * 1024  # 500MB limit
-    
     print("\nCollecting files for analysis...")
-    for root, _, files in os.walk(extracted_dir):
-        for file in files:
-            full_path = os.path.join(root, file)
-            try:
-                # Quick file filtering
-                if os.path.splitext(file)[1].lower() in {'.jpg', '.png', '.gif', '.mp3', '.mp4'}:
-                    continue
-                
-                size = os.path.getsize(full_path)
-                if size < 64 or size > 10_000_000:  # Skip tiny/huge files
-                    continue
-                
-                total_size += size
-                if total_size > MAX_TOTAL_SIZE:
-                    print("Warning: Total file size exceeds limit, some files will be skipped")
-                    break
-                
-                all_files.append(full_path)
-            except:
-                continue
-    
-    print(f"Found {len(all_files)} files to analyze")
-    
-    # Process in smaller chunks
-    chunk_size = 50  # Process 50 files at a time
-    chunks = [all_files[i:i + chunk_size] for i in range(0, len(all_files), chunk_size)]
+    file_sizes = collect_files(extracted_dir)
+    manifest = build_manifest(analysis_id, args.firmware, extracted_dir, file_sizes)
+    symbol_index = build_symbol_index(manifest)
+    apply_symbol_findings(manifest, symbol_index)
+    all_files = apply_baseline(manifest, baseline)
+    entries = {entry['path']: entry for entry in manifest['files'].values()}
+    print(f"Indexed symbols of {len(symbol_index.binaries)} ELF binaries")
+    if baseline:
+        print(f"Found {len(file_sizes)} files, {len(all_files)} changed since {baseline['analysis_id']}")
+    else:
+        print(f"Found {len(all_files)} files to analyze")
     
     all_vulnerabilities = []
+    delta = None
     files_analyzed = 0
     
     try:
@@ -990,24 +3801,27 @@ def main():
         
         print("\nAnalyzing files...")
         with tqdm(total=len(all_files), desc="Progress", ncols=100) as pbar:
-            for i in range(0, len(all_files), chunk_size):
-                chunk = all_files[i:i + chunk_size]
-                vulns = parallel_file_scan(chunk, args.verbose)
-                if vulns:
-                    all_vulnerabilities.extend(vulns)
-                files_analyzed += len(chunk)
-                pbar.update(len(chunk))
+            for index, vulns in iter_file_scan(all_files, args.verbose, sizes=file_sizes,
+                                               described=manifest_described(manifest)):
+                entries[all_files[index]]['findings'] = vulns
+                files_analyzed += 1
+                pbar.update(1)
                 
-                if args.verbose:
-                    print(f"\nFound {len(vulns)} vulnerabilities in current chunk")
+                if args.verbose and vulns:
+                    print(f"\nFound {len(vulns)} vulnerabilities in {all_files[index]}")
         
     except KeyboardInterrupt:
         print("\nAnalysis interrupted by user.")
     except Exception as e:
         print(f"\nError during analysis: {str(e)}")
     finally:
-        if files_analyzed > 0:
-            report = generate_report(all_vulnerabilities, args.json)
+        # Report in collection order whatever finished, even after an interrupt
+        all_vulnerabilities.extend(manifest_findings(manifest))
+        delta = compare_manifests(baseline, manifest) if baseline else None
+        save_manifest(manifest)
+        print(f"\nAnalysis ID: {analysis_id}")
+        if files_analyzed > 0 or delta:
+            report = generate_report(all_vulnerabilities, args.json, delta, manifest_file_classes(manifest))
             if args.json:
                 output_file = f"{os.path.splitext(args.firmware)[0]}_vulnerabilities.json"
                 with open(output_file, 'w') as f:
@@ -1032,7 +3846,7 @@ def main():
     print("\n" + "=" * 50)
     print(f"Analysis Complete - Examined {files_analyzed} files")
     print("=" * 50)
-    print(generate_report(all_vulnerabilities))
+    print(generate_report(all_vulnerabilities, delta=delta, file_classes=manifest_file_classes(manifest)))
 
 if __name__ == "__main__":
     main()